@@ -1,5 +1,10 @@
 import numpy
 import cProfile
+import multiprocessing
+import os
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor
 
 from math import sin, cos, pi, atan2, sqrt
 
@@ -13,6 +18,83 @@ import time
 # given an array of positions, and sensors, return an array of all objects that are within each sensor's range
 
 
+class SparseVisibility:
+    """the visible objects of every sensor in compressed sparse row form - the stimuli of sensor i are at
+    offsets[i]:offsets[i + 1] of the object index, relative x and y, distance and angle arrays, so memory grows with the
+    number of visible pairs rather than sensors * objects"""
+
+    def __init__(self, offsets, objects, relative_x, relative_y, distances, angles):
+        self.offsets = offsets
+        self.objects = objects
+        self.relative_x = relative_x
+        self.relative_y = relative_y
+        self.distances = distances
+        self.angles = angles
+
+    @classmethod
+    def from_pairs(cls, n_sensors, sensor_indices, object_indices, relative_positions, distances, angles):
+        """builds the sparse result from visible pairs, which must already be ordered by sensor"""
+        offsets = numpy.zeros(n_sensors + 1, dtype=numpy.intp)
+        numpy.cumsum(numpy.bincount(sensor_indices, minlength=n_sensors), out=offsets[1:])
+        return cls(offsets, object_indices, relative_positions[:, 0], relative_positions[:, 1], distances, angles)
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, sensor):
+        """object indices, relative x, relative y, distances and angles of the objects the sensor can see"""
+        start, end = self.offsets[sensor], self.offsets[sensor + 1]
+        return (self.objects[start:end], self.relative_x[start:end], self.relative_y[start:end],
+                self.distances[start:end], self.angles[start:end])
+
+    def __iter__(self):
+        for sensor in range(len(self)):
+            yield self[sensor]
+
+    def count(self):
+        return len(self.objects)
+
+    def to_dense(self, n_objects):
+        """the (sensors, objects, 4) array the dense variants return"""
+        dense = numpy.zeros((len(self), n_objects, 4))
+        sensor_indices = numpy.repeat(numpy.arange(len(self)), numpy.diff(self.offsets))
+        dense[sensor_indices, self.objects] = numpy.column_stack((self.relative_x, self.relative_y, self.distances,
+                                                                  self.angles))
+        return dense
+
+
+# Canonical visibility test
+# an object is visible to a sensor when it is within the sensor's range, and at most FOV / 2 either side of the
+# sensor's direction (so the test never depends on where angles wrap around). an object exactly on the sensor is
+# visible. every variant below gives the same stimuli: relative x and y, the distance, and the angle of the object
+# from the sensor's direction, in [-pi, pi]
+
+def get_cones(sensors):
+    """per sensor values the cone test needs - the unit direction, the squared range, and cos(FOV / 2) * |cos(FOV / 2)|
+    to compare against"""
+    cos_half = numpy.cos(numpy.minimum(sensors[:, 4], 2 * pi) / 2)
+    return numpy.cos(sensors[:, 2]), numpy.sin(sensors[:, 2]), numpy.square(sensors[:, 3]), cos_half * numpy.abs(
+        cos_half)
+
+
+def in_cone(relative_x, relative_y, distances_squared, direction_x, direction_y, ranges_squared, thresholds):
+    """the visibility test on relative positions, broadcasting over any shape. the angle test is
+    dot(relative, direction) >= |relative| * cos(FOV / 2), with each side multiplied by its own absolute value -
+    which keeps the order of the two, and leaves only squared distances, so there is no sqrt or arctan2"""
+    dot = relative_x * direction_x + relative_y * direction_y
+    return (distances_squared <= ranges_squared) & (dot * numpy.abs(dot) >= thresholds * distances_squared)
+
+
+def get_relative_angles(relative_x, relative_y, direction_x, direction_y):
+    """the angle of each relative position from its sensor's direction, from the cross and dot products"""
+    return numpy.arctan2(direction_x * relative_y - direction_y * relative_x,
+                         direction_x * relative_x + direction_y * relative_y)
+
+
+def wrap_angle(angle):
+    return (angle + pi) % (2 * pi) - pi
+
+
 # Naive implementation
 
 def get_visible_naive(positions, sensors):
@@ -25,7 +107,7 @@ def get_visible_naive(positions, sensors):
             # if the object is within range and FOV, add it to the list of stimuli
             rel_x, rel_y = x2 - x, y2 - y
             if sqrt(rel_x ** 2 + rel_y ** 2) <= _range:
-                if abs(atan2(rel_y, rel_x) - direction) <= FOV / 2:
+                if rel_x == rel_y == 0 or abs(wrap_angle(atan2(rel_y, rel_x) - direction)) <= FOV / 2:
                     stimuli.append([x2, y2, direction2])
         sensor_data.append(stimuli)
     return sensor_data
@@ -40,106 +122,399 @@ def get_visible_naive_no_sqrt(positions, sensors):
             # if the object is within range and FOV, add it to the list of stimuli
             rel_x, rel_y = x2 - x, y2 - y
             if rel_x ** 2 + rel_y ** 2 <= _range ** 2:
-                if abs(atan2(rel_y, rel_x) - direction) <= FOV / 2:
+                if rel_x == rel_y == 0 or abs(wrap_angle(atan2(rel_y, rel_x) - direction)) <= FOV / 2:
                     stimuli.append([x2, y2, direction2])
         sensor_data.append(stimuli)
     return sensor_data
 
 
-def get_visible_numpy(positions, sensors):
+def get_visible_numpy(positions, sensors, sparse=False):
     # vectorize nested for loop
     # calculate relative positions of all objects from each sensor:
-    relative_positions = numpy.zeros((len(sensors), len(positions), 4))
-    relative_positions[:, :, :2] = positions[:, :2] - sensors[:, numpy.newaxis, :2]
+    relative_positions = positions[:, :2] - sensors[:, numpy.newaxis, :2]
+    relative_x, relative_y = relative_positions[:, :, 0], relative_positions[:, :, 1]
+    direction_x, direction_y, ranges_squared, thresholds = (values[:, numpy.newaxis] for values in get_cones(sensors))
+
     # calculate distance from each sensor to each object:
-    distances = numpy.sqrt(numpy.sum(relative_positions[:, :, :2] ** 2, axis=2))
-    distance_mask = distances <= sensors[:, numpy.newaxis, 3]
+    distances_squared = numpy.sum(relative_positions ** 2, axis=2)
+    mask = in_cone(relative_x, relative_y, distances_squared, direction_x, direction_y, ranges_squared, thresholds)
 
     # calculate angle from each sensor to each object:
-    angles = numpy.arctan2(relative_positions[:, :, 1], relative_positions[:, :, 0])
-    angle_mask = numpy.abs(angles - sensors[:, numpy.newaxis, 2]) <= sensors[:, numpy.newaxis, 4] / 2
+    distances = numpy.sqrt(distances_squared)
+    angles = get_relative_angles(relative_x, relative_y, direction_x, direction_y)
 
-    # print(distances, distances.shape)
-    # print(sensors[:, 3], sensors[:, 3].shape)
-    # print(angles, angles.shape)
-    # print(sensors[:, 2], sensors[:, 2].shape)
-
-    relative_positions[:, :, 2] = distances
-    relative_positions[:, :, 3] = angles
-
-    # create a list of lists of stimuli for each sensor from the original positions array:
+    if sparse:
+        sensor_indices, object_indices = numpy.nonzero(mask)
+        return SparseVisibility.from_pairs(len(sensors), sensor_indices, object_indices,
+                                           relative_positions[sensor_indices, object_indices],
+                                           distances[sensor_indices, object_indices],
+                                           angles[sensor_indices, object_indices])
 
     # replace all positions that are not within range or FOV with 0
-    relative_positions[~distance_mask | ~angle_mask] = 0
-
-    # relative_positions = relative_positions[distance_mask & angle_mask]
-    #print(f"{distances[distance_mask & angle_mask].shape} visible objects")
-    return relative_positions
+    visible_positions = numpy.concatenate((relative_positions, distances[:, :, numpy.newaxis],
+                                           angles[:, :, numpy.newaxis]), axis=2)
+    visible_positions[~mask] = 0
+    return visible_positions
 
 
-def get_visible_numpy_early_exit(positions, sensors):
-    # wip - currently slower
+def get_visible_numpy_early_exit(positions, sensors, sparse=False):
+    # only the pairs within range go on to the angle test, and only visible pairs get a distance and angle
 
-    relative_positions = numpy.zeros((len(sensors), len(positions), 4))
-    relative_positions[:, :, :2] = positions[:, :2] - sensors[:, numpy.newaxis, :2]
-    distances = numpy.sqrt(numpy.sum(relative_positions[:, :, :2] ** 2, axis=2))
-    distance_mask = distances <= sensors[:, numpy.newaxis, 3]
-    # where distance_mask is False, set all values in relative_positions to 0
-    relative_positions[:, :, 2] = distances
-    relative_positions[~distance_mask] = 0
+    relative_positions = positions[:, :2] - sensors[:, numpy.newaxis, :2]
+    distances_squared = numpy.sum(relative_positions ** 2, axis=2)
+    direction_x, direction_y, ranges_squared, thresholds = get_cones(sensors)
 
     # early exit if object is not within range
-    angles = numpy.where(relative_positions[:, :, 2] == 0, 0,
-                         numpy.arctan2(relative_positions[:, :, 1], relative_positions[:, :, 0]))
-    angle_mask = numpy.abs(angles - sensors[:, numpy.newaxis, 2]) <= sensors[:, numpy.newaxis, 4] / 2
-
-    relative_positions[:, :, 3] = angles
-    relative_positions[~angle_mask] = 0
-    #print(f"{distances[distance_mask & angle_mask].shape} visible objects")
+    sensor_indices, object_indices = numpy.nonzero(distances_squared <= ranges_squared[:, numpy.newaxis])
+    relative = relative_positions[sensor_indices, object_indices]
+    mask = in_cone(relative[:, 0], relative[:, 1], distances_squared[sensor_indices, object_indices],
+                   direction_x[sensor_indices], direction_y[sensor_indices], ranges_squared[sensor_indices],
+                   thresholds[sensor_indices])
 
-    return relative_positions
+    sensor_indices, object_indices, relative = sensor_indices[mask], object_indices[mask], relative[mask]
+    distances = numpy.sqrt(distances_squared[sensor_indices, object_indices])
+    angles = get_relative_angles(relative[:, 0], relative[:, 1], direction_x[sensor_indices],
+                                 direction_y[sensor_indices])
 
+    if sparse:
+        return SparseVisibility.from_pairs(len(sensors), sensor_indices, object_indices, relative, distances, angles)
 
-def get_visible_numpy_optimized(positions, sensors):
-    relative_positions = positions[:, numpy.newaxis, :2] - sensors[:, :2]
     visible_positions = numpy.zeros((len(sensors), len(positions), 4))
+    visible_positions[sensor_indices, object_indices] = numpy.column_stack((relative, distances, angles))
+    return visible_positions
+
 
-    distances = numpy.sum(numpy.square(relative_positions[:, :, :2]), axis=2)
-    angles = numpy.arctan2(relative_positions[:, :, 1], relative_positions[:, :, 0])
+def get_visible_numpy_optimized(positions, sensors, sparse=False):
+    relative_x = positions[:, 0] - sensors[:, 0, numpy.newaxis]
+    relative_y = positions[:, 1] - sensors[:, 1, numpy.newaxis]
+    direction_x, direction_y, ranges_squared, thresholds = (values[:, numpy.newaxis] for values in get_cones(sensors))
 
-    distance_mask = distances <= numpy.square(sensors[:, 3])
-    angle_mask = numpy.logical_and(
-        -sensors[:, 4] / 2 <= angles - sensors[:, 2],
-        angles - sensors[:, 2] <= sensors[:, 4] / 2,
-    )
+    distances_squared = numpy.square(relative_x) + numpy.square(relative_y)
+    mask = in_cone(relative_x, relative_y, distances_squared, direction_x, direction_y, ranges_squared, thresholds)
 
-    visible_positions[distance_mask & angle_mask, :2] = relative_positions[distance_mask & angle_mask]
+    # the sqrt and arctan2 are only worked out for visible pairs
+    sensor_indices, object_indices = numpy.nonzero(mask)
+    visible_x, visible_y = relative_x[mask], relative_y[mask]
+    distances = numpy.sqrt(distances_squared[mask])
+    angles = get_relative_angles(visible_x, visible_y, direction_x[sensor_indices, 0], direction_y[sensor_indices, 0])
 
-    visible_positions[distance_mask & angle_mask, 2] = distances[distance_mask & angle_mask]
-    visible_positions[distance_mask & angle_mask, 3] = angles[distance_mask & angle_mask]
+    if sparse:
+        return SparseVisibility.from_pairs(len(sensors), sensor_indices, object_indices,
+                                           numpy.column_stack((visible_x, visible_y)), distances, angles)
 
-    #print(f"{distances[distance_mask & angle_mask].shape} visible objects")
+    visible_positions = numpy.zeros((len(sensors), len(positions), 4))
+    visible_positions[mask] = numpy.column_stack((visible_x, visible_y, distances, angles))
     return visible_positions
 
 
-def get_visible_numpy_optimized_2(positions, sensors):
-    relative_positions = positions[:, numpy.newaxis, :2] - sensors[:, :2]
+def get_visible_numpy_optimized_2(positions, sensors, sparse=False):
+    # as get_visible_numpy_optimized, with the (sensors, objects) temporaries reused through out= rather than each
+    # operation allocating another
+    relative_x = numpy.subtract(positions[:, 0], sensors[:, 0, numpy.newaxis])
+    relative_y = numpy.subtract(positions[:, 1], sensors[:, 1, numpy.newaxis])
+    direction_x, direction_y, ranges_squared, thresholds = (values[:, numpy.newaxis] for values in get_cones(sensors))
+
+    distances_squared = numpy.square(relative_x)
+    distances_squared += numpy.square(relative_y)
+    dot = numpy.multiply(relative_x, direction_x)
+    scratch = numpy.multiply(relative_y, direction_y)
+    dot += scratch
+    numpy.abs(dot, out=scratch)
+    scratch *= dot
+    dot = numpy.multiply(distances_squared, thresholds, out=dot)
+    mask = numpy.greater_equal(scratch, dot)
+    mask &= distances_squared <= ranges_squared
+
+    sensor_indices, object_indices = numpy.nonzero(mask)
+    visible_x, visible_y = relative_x[mask], relative_y[mask]
+    distances = numpy.sqrt(distances_squared[mask])
+    angles = get_relative_angles(visible_x, visible_y, direction_x[sensor_indices, 0], direction_y[sensor_indices, 0])
+
+    if sparse:
+        return SparseVisibility.from_pairs(len(sensors), sensor_indices, object_indices,
+                                           numpy.column_stack((visible_x, visible_y)), distances, angles)
+
     visible_positions = numpy.zeros((len(sensors), len(positions), 4))
+    visible_positions[mask] = numpy.column_stack((visible_x, visible_y, distances, angles))
+    return visible_positions
 
-    distances = numpy.sum(numpy.square(relative_positions[:, :, :2]), axis=2)
-    angles = numpy.arctan2(relative_positions[:, :, 1], relative_positions[:, :, 0])
 
-    distance_angle_mask = (distances <= numpy.square(sensors[:, 3])) & \
-                          (-sensors[:, 4] / 2 <= angles - sensors[:, 2]) & \
-                          (angles - sensors[:, 2] <= sensors[:, 4] / 2)
+class SpatialGrid:
+    """a uniform grid over the objects, rebuilt every tick with a counting sort - the objects are sorted by cell (a
+    stable argsort of small integer cell ids, which numpy does as a radix sort), and bincount gives where each cell's
+    objects start and how many there are. a sensor then only needs to test the objects in the cells its range overlaps,
+    rather than every object"""
+
+    def __init__(self, positions, cell_size):
+        self.cell_size = cell_size
+        self.origin = positions[:, :2].min(axis=0) if len(positions) else numpy.zeros(2)
+        extent = positions[:, :2].max(axis=0) - self.origin if len(positions) else numpy.zeros(2)
+        self.columns, self.rows = (extent // cell_size).astype(int) + 1
+        n_cells = self.columns * self.rows
+        self.dtype = numpy.uint16 if n_cells <= numpy.iinfo(numpy.uint16).max else numpy.uint32
+
+        cells = self.get_cells(positions)
+        self.order = numpy.argsort(cells, kind="stable")
+        self.counts = numpy.bincount(cells, minlength=n_cells)
+        self.starts = numpy.cumsum(self.counts) - self.counts
+
+    def get_cells(self, points):
+        columns, rows = ((points[:, :2] - self.origin) // self.cell_size).astype(int).T
+        return (numpy.clip(rows, 0, self.rows - 1) * self.columns + numpy.clip(columns, 0, self.columns - 1)).astype(
+            self.dtype)
+
+    def get_candidates(self, sensors):
+        """pairs of sensor and object indices for every object in a cell each sensor's range overlaps, ordered by
+        sensor"""
+        # how many cells out from its own a sensor's range can reach
+        reach = int(numpy.ceil(sensors[:, 3].max() / self.cell_size)) if len(sensors) else 0
+        steps = numpy.arange(-reach, reach + 1)
+        columns, rows = ((sensors[:, :2] - self.origin) // self.cell_size).astype(int).T
+        columns = columns[:, numpy.newaxis, numpy.newaxis] + steps
+        rows = rows[:, numpy.newaxis, numpy.newaxis] + steps[:, numpy.newaxis]
+        inside = (columns >= 0) & (columns < self.columns) & (rows >= 0) & (rows < self.rows)
+        cells = numpy.where(inside, rows * self.columns + columns, 0).reshape(len(sensors), -1)
+
+        counts = numpy.where(inside.reshape(len(sensors), -1), self.counts[cells], 0).ravel()
+        starts = self.starts[cells].ravel()
+        sensor_indices = numpy.repeat(numpy.repeat(numpy.arange(len(sensors)), cells.shape[1]), counts)
+
+        # the index of each pair within the sorted objects - its cell's start, plus how far it is into the cell
+        offsets = numpy.cumsum(counts) - counts
+        object_indices = self.order[numpy.repeat(starts - offsets, counts) + numpy.arange(counts.sum())]
+        return sensor_indices, object_indices
+
+
+def get_visible_grid(positions, sensors, cell_size=None, sparse=False):
+    """the same result as get_visible_numpy, only testing the pairs a SpatialGrid finds. the grid's cells default to
+    the size of the longest sensor range, so each sensor only looks at the 3x3 cells around its own"""
+    if not len(positions) or not len(sensors):
+        empty = numpy.zeros(0)
+        return SparseVisibility.from_pairs(len(sensors), empty.astype(numpy.intp), empty.astype(numpy.intp),
+                                           numpy.zeros((0, 2)), empty, empty) if sparse else \
+            numpy.zeros((len(sensors), len(positions), 4))
+
+    grid = SpatialGrid(positions, cell_size or max(sensors[:, 3].max(), 1))
+    sensor_indices, object_indices = grid.get_candidates(sensors)
+    direction_x, direction_y, ranges_squared, thresholds = (values[sensor_indices] for values in get_cones(sensors))
+
+    relative_positions = positions[object_indices, :2] - sensors[sensor_indices, :2]
+    relative_x, relative_y = relative_positions[:, 0], relative_positions[:, 1]
+    mask = in_cone(relative_x, relative_y, numpy.square(relative_x) + numpy.square(relative_y), direction_x,
+                   direction_y, ranges_squared, thresholds)
+
+    # candidates come out grouped by cell within each sensor - ordering the visible ones by object as well gives the
+    # same stimuli in the same order as the other variants
+    visible = numpy.flatnonzero(mask)
+    visible = visible[numpy.argsort(sensor_indices[visible] * len(positions) + object_indices[visible], kind="stable")]
+    sensor_indices, object_indices, relative_positions = sensor_indices[visible], object_indices[visible], \
+        relative_positions[visible]
+    direction_x, direction_y = direction_x[visible], direction_y[visible]
+    distances = numpy.hypot(relative_positions[:, 0], relative_positions[:, 1])
+    angles = get_relative_angles(relative_positions[:, 0], relative_positions[:, 1], direction_x, direction_y)
+    if sparse:
+        return SparseVisibility.from_pairs(len(sensors), sensor_indices, object_indices, relative_positions,
+                                           distances, angles)
 
-    visible_positions[distance_angle_mask, :2] = relative_positions[distance_angle_mask]
+    visible_positions = numpy.zeros((len(sensors), len(positions), 4))
+    visible_positions[sensor_indices, object_indices] = numpy.column_stack((relative_positions, distances, angles))
+    return visible_positions
 
-    visible_positions[distance_angle_mask, 2] = distances[distance_angle_mask]
-    visible_positions[distance_angle_mask, 3] = angles[distance_angle_mask]
 
-    #print(f"{numpy.count_nonzero(distance_angle_mask)} visible objects")
-    return visible_positions
+class TiledVisibility:
+    """evaluates the cone test a tile of sensors at a time, so only (tile_size, objects) temporaries exist at once
+    rather than (sensors, objects) ones. the temporaries are preallocated and reused across calls (only growing when
+    there are more objects than before), and every operation writes into them through out=. with no tile size given,
+    tiles are sized so that one tile's temporaries fit in CACHE_BYTES.
+
+    only the temporaries are reused - each tile's visible pairs are gathered into new arrays and joined by merge, as the
+    result is handed to the caller and can't share memory with the next call. those allocations grow with the number
+    of visible pairs, not sensors * objects"""
+    CACHE_BYTES = 1 << 20  # roughly a core's L2 cache
+    BYTES_PER_PAIR = 5 * 8 + 2  # five float64 temporaries and two bool masks
+
+    def __init__(self, tile_size=None):
+        self.tile_size = tile_size
+        self.capacity = (0, 0)
+        self.reserve(1, 0)
+
+    def get_tile_size(self, n_objects, tile_size=None):
+        if tile_size or self.tile_size:
+            return tile_size or self.tile_size
+        return max(1, self.CACHE_BYTES // (max(n_objects, 1) * self.BYTES_PER_PAIR))
+
+    def reserve(self, tile_size, n_objects):
+        """makes sure the temporaries can hold a tile of tile_size sensors by n_objects objects"""
+        if tile_size <= self.capacity[0] and n_objects <= self.capacity[1]:
+            return
+        self.capacity = (max(tile_size, self.capacity[0]), max(n_objects, self.capacity[1]))
+        self.relative_x, self.relative_y, self.distances_squared, self.dot, self.scratch = numpy.empty(
+            (5, *self.capacity))
+        self.mask, self.range_mask = numpy.empty((2, *self.capacity), dtype=bool)
+
+    def query(self, positions, sensors, tile_size=None):
+        """the visible objects of every sensor, as a SparseVisibility. tile_size overrides the evaluator's own for this
+        call"""
+        positions_x, positions_y = numpy.ascontiguousarray(positions[:, 0]), numpy.ascontiguousarray(positions[:, 1])
+        cones = get_cones(sensors)
+        return self.merge(self.evaluate(positions_x, positions_y, sensors, cones, tile_size=tile_size), cones)
+
+    def evaluate(self, positions_x, positions_y, sensors, cones, first=0, last=None, tile_size=None):
+        """the visible pairs of sensors first to last, as pieces for merge"""
+        last = len(sensors) if last is None else last
+        n_objects = len(positions_x)
+        tile_size = self.get_tile_size(n_objects, tile_size)
+        self.reserve(min(tile_size, max(last - first, 1)), n_objects)
+        tile_size = min(tile_size, self.capacity[0])
+        direction_x, direction_y, ranges_squared, thresholds = (values[:, numpy.newaxis] for values in cones)
+
+        pieces = []
+        for start in range(first, last, tile_size):
+            end = min(start + tile_size, last)
+            rows = end - start
+            relative_x, relative_y = self.relative_x[:rows, :n_objects], self.relative_y[:rows, :n_objects]
+            distances_squared = self.distances_squared[:rows, :n_objects]
+            dot, scratch = self.dot[:rows, :n_objects], self.scratch[:rows, :n_objects]
+            mask, range_mask = self.mask[:rows, :n_objects], self.range_mask[:rows, :n_objects]
+
+            numpy.subtract(positions_x, sensors[start:end, 0, numpy.newaxis], out=relative_x)
+            numpy.subtract(positions_y, sensors[start:end, 1, numpy.newaxis], out=relative_y)
+            numpy.multiply(relative_x, relative_x, out=distances_squared)
+            numpy.multiply(relative_y, relative_y, out=scratch)
+            distances_squared += scratch
+
+            # in_cone, written into the temporaries
+            numpy.multiply(relative_x, direction_x[start:end], out=dot)
+            numpy.multiply(relative_y, direction_y[start:end], out=scratch)
+            dot += scratch
+            numpy.abs(dot, out=scratch)
+            scratch *= dot
+            numpy.multiply(distances_squared, thresholds[start:end], out=dot)
+            numpy.greater_equal(scratch, dot, out=mask)
+            numpy.less_equal(distances_squared, ranges_squared[start:end], out=range_mask)
+            mask &= range_mask
+
+            sensor_indices, object_indices = numpy.nonzero(mask)
+            pieces.append((sensor_indices + start, object_indices, relative_x[sensor_indices, object_indices],
+                           relative_y[sensor_indices, object_indices],
+                           distances_squared[sensor_indices, object_indices]))
+        return pieces
+
+    @staticmethod
+    def merge(pieces, cones):
+        """one SparseVisibility from the pieces of every sensor, in order of sensor"""
+        direction_x, direction_y = cones[0], cones[1]
+        if pieces:
+            sensor_indices, object_indices, visible_x, visible_y, distances_squared = (numpy.concatenate(arrays)
+                                                                                       for arrays in zip(*pieces))
+        else:
+            sensor_indices = object_indices = numpy.zeros(0, dtype=numpy.intp)
+            visible_x = visible_y = distances_squared = numpy.zeros(0)
+        angles = get_relative_angles(visible_x, visible_y, direction_x[sensor_indices], direction_y[sensor_indices])
+        return SparseVisibility.from_pairs(len(direction_x), sensor_indices, object_indices,
+                                           numpy.column_stack((visible_x, visible_y)), numpy.sqrt(distances_squared),
+                                           angles)
+
+
+_tiled = TiledVisibility()
+
+
+def get_visible_tiled(positions, sensors, tile_size=None, sparse=False):
+    """the same result as get_visible_numpy, evaluated by a TiledVisibility kept between calls"""
+    result = _tiled.query(positions, sensors, tile_size)
+    return result if sparse else result.to_dense(len(positions))
+
+
+class ParallelVisibility:
+    """evaluates tiles of sensors on a pool of threads - numpy's ufuncs release the GIL, so the threads' tiles really
+    are worked on at once. the sensors are split into contiguous blocks (a few per worker, so a slow block doesn't
+    leave the other threads idle), each thread evaluates blocks with its own TiledVisibility and scratch, and the
+    blocks' pairs are merged in order into a single sparse result"""
+    BLOCKS_PER_WORKER = 4
+
+    def __init__(self, workers=None, tile_size=None):
+        self.workers = workers or os.cpu_count()
+        self.tile_size = tile_size
+        self.executor = ThreadPoolExecutor(self.workers)
+        self.local = threading.local()
+
+    def get_evaluator(self):
+        if not hasattr(self.local, "evaluator"):
+            self.local.evaluator = TiledVisibility(self.tile_size)
+        return self.local.evaluator
+
+    def query(self, positions, sensors):
+        positions_x, positions_y = numpy.ascontiguousarray(positions[:, 0]), numpy.ascontiguousarray(positions[:, 1])
+        cones = get_cones(sensors)
+        bounds = numpy.linspace(0, len(sensors), min(self.workers * self.BLOCKS_PER_WORKER, len(sensors)) + 1)
+        bounds = bounds.astype(int).tolist()
+
+        blocks = self.executor.map(lambda block: self.get_evaluator().evaluate(positions_x, positions_y, sensors,
+                                                                               cones, *block),
+                                   zip(bounds, bounds[1:]))
+        return TiledVisibility.merge([piece for pieces in blocks for piece in pieces], cones)
+
+    def close(self):
+        self.executor.shutdown()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+_parallel = {}
+
+
+def get_visible_parallel(positions, sensors, workers=None, tile_size=None, sparse=False):
+    """the same result as get_visible_numpy, evaluated on a ParallelVisibility kept between calls"""
+    key = (workers, tile_size)
+    if key not in _parallel:
+        _parallel[key] = ParallelVisibility(workers, tile_size)
+    result = _parallel[key].query(positions, sensors)
+    return result if sparse else result.to_dense(len(positions))
+
+
+def get_random_scene(rng, n_positions, n_sensors, width=1920, height=1080):
+    """objects and sensors in a width x height world, with some sensors facing almost exactly along 0 / 2pi, some with
+    FOVs of more than pi, and some objects sitting exactly on a sensor"""
+    positions = rng.random((n_positions, 3)) * numpy.array([width, height, 2 * pi])
+    sensors = rng.random((n_sensors, 5)) * numpy.array([width, height, 2 * pi, 100, 2 * pi])
+    sensors[::4, 2] = rng.choice([-1e-6, 0, 1e-6, 2 * pi - 1e-6, 2 * pi], len(sensors[::4]))
+    if n_positions and n_sensors:
+        positions[:min(n_positions, n_sensors) // 5, :2] = sensors[:min(n_positions, n_sensors) // 5, :2]
+    return positions, sensors
+
+
+# every variant returning a dense or sparse result, with the keyword arguments to call it with
+VARIANTS = [(get_visible_numpy, {}), (get_visible_numpy_early_exit, {}), (get_visible_numpy_optimized, {}),
+            (get_visible_numpy_optimized_2, {}), (get_visible_grid, {}), (get_visible_grid, {"cell_size": 17}),
+            (get_visible_tiled, {}), (get_visible_tiled, {"tile_size": 7}), (get_visible_parallel, {"workers": 3}),
+            (get_visible_parallel, {"workers": 2, "tile_size": 5})]
+
+
+def check_variants(trials=50, seed=0):
+    """property check - on random scenes, every variant must see the same objects as get_visible_naive (which tests
+    the wrapped atan2 angle, rather than the cone), get_visible_naive_no_sqrt must agree with it, and the dense and
+    sparse results of every other variant must match get_visible_numpy's stimuli"""
+    rng = numpy.random.default_rng(seed)
+    for trial in range(trials):
+        positions, sensors = get_random_scene(rng, int(rng.integers(0, 200)), int(rng.integers(0, 100)))
+        expected = get_visible_naive(positions, sensors)
+        assert get_visible_naive_no_sqrt(positions, sensors) == expected, "get_visible_naive_no_sqrt"
+
+        reference = get_visible_numpy(positions, sensors)
+        for function, kwargs in VARIANTS:
+            name = f"{function.__name__}({kwargs})"
+            dense = function(positions, sensors, **kwargs)
+            result = function(positions, sensors, sparse=True, **kwargs)
+            seen = [positions[objects].tolist() for objects, *_ in result]
+            assert seen == expected, f"{name} sees different objects to get_visible_naive in trial {trial}"
+            assert numpy.allclose(dense, reference), f"{name} gives different stimuli in trial {trial}"
+            assert numpy.allclose(result.to_dense(len(positions)), reference), f"{name} sparse, trial {trial}"
+    print(f"all variants agree over {trials} random scenes")
+
 
 # @njit
 # def get_visible_naive_jit(positions, sensors):
@@ -151,7 +526,7 @@ def get_visible_numpy_optimized_2(positions, sensors):
 #             # if the object is within range and FOV, add it to the list of stimuli
 #             rel_x, rel_y = x2 - x, y2 - y
 #             if rel_x ** 2 + rel_y ** 2 <= _range ** 2:
-#                 if abs(atan2(rel_y, rel_x) - direction) <= FOV / 2:
+#                 if rel_x == rel_y == 0 or abs(wrap_angle(atan2(rel_y, rel_x) - direction)) <= FOV / 2:
 #                     stimuli.append([x2, y2, direction2])
 #         sensor_data.append(stimuli)
 #     return sensor_data
@@ -166,7 +541,7 @@ def get_visible_numpy_optimized_2(positions, sensors):
 #             # if the object is within range and FOV, add it to the list of stimuli
 #             rel_x, rel_y = x2 - x, y2 - y
 #             if rel_x ** 2 + rel_y ** 2 <= _range ** 2:
-#                 if abs(atan2(rel_y, rel_x) - direction) <= FOV / 2:
+#                 if rel_x == rel_y == 0 or abs(wrap_angle(atan2(rel_y, rel_x) - direction)) <= FOV / 2:
 #                     stimuli.append([x2, y2, direction2])
 #         sensor_data.append(stimuli)
 #     return sensor_data
@@ -182,7 +557,77 @@ def benchmark(function, *args, maxtime=5, **kwargs):
     print(f"{function.__name__}:\nCount:\t\tDuration (s):\t\tAverage (ms):\n"
           f"{count}\t\t\t{round(duration,4)}\t\t\t\t{round(duration / count * 1000, 4)}\n")
 
+
+def _measure_peak(function_name, n_positions, n_sensors, kwargs, connection):
+    import resource
+
+    positions, sensors = get_random_scene(numpy.random.default_rng(0), n_positions, n_sensors)
+    if function_name is not None:
+        start = time.perf_counter()
+        globals()[function_name](positions, sensors, **kwargs)
+        duration = time.perf_counter() - start
+    else:
+        duration = 0
+    connection.send((resource.getrusage(resource.RUSAGE_SELF).ru_maxrss, duration))
+
+
+def measure_peak(function_name, n_positions, n_sensors, **kwargs):
+    """peak resident memory (KiB) of a fresh spawned process making a scene and calling the named variant once, and
+    how long the call took. unix only, as it reads ru_maxrss"""
+    context = multiprocessing.get_context("spawn")
+    connection, child_connection = context.Pipe()
+    process = context.Process(target=_measure_peak, args=(function_name, n_positions, n_sensors, kwargs,
+                                                          child_connection))
+    process.start()
+    peak, duration = connection.recv()
+    process.join()
+    return peak, duration
+
+
+def benchmark_memory(n_positions=5000, n_sensors=5000):
+    """peak RSS above a process that only makes the scene, and throughput in sensor-object pairs per second, of each
+    vectorized variant"""
+    baseline, _ = measure_peak(None, n_positions, n_sensors)
+    print(f"{n_sensors} sensors, {n_positions} objects:\n"
+          f"Variant:\t\t\t\t\t\t\t\tPeak RSS (MiB):\t\tPairs per second (M):")
+    for function, kwargs in [(get_visible_numpy, {}), (get_visible_numpy_optimized_2, {}),
+                             (get_visible_numpy_optimized_2, {"sparse": True}), (get_visible_grid, {"sparse": True}),
+                             (get_visible_tiled, {"sparse": True}),
+                             (get_visible_tiled, {"sparse": True, "tile_size": 256}),
+                             (get_visible_parallel, {"sparse": True})]:
+        peak, duration = measure_peak(function.__name__, n_positions, n_sensors, **kwargs)
+        name = f"{function.__name__}({', '.join(f'{key}={value}' for key, value in kwargs.items())})"
+        print(f"{name:<64}{round((peak - baseline) / 1024, 1)}\t\t\t\t\t"
+              f"{round(n_positions * n_sensors / duration / 1e6, 1)}")
+
+
+def benchmark_scaling(n_positions=5000, n_sensors=5000, max_workers=None, repeats=5):
+    """throughput of get_visible_parallel with 1 up to max_workers threads"""
+    positions, sensors = get_random_scene(numpy.random.default_rng(0), n_positions, n_sensors)
+    print(f"{n_sensors} sensors, {n_positions} objects:\nWorkers:\t\tAverage (ms):\t\tSpeedup:")
+    single = None
+    for workers in range(1, (max_workers or os.cpu_count()) + 1):
+        with ParallelVisibility(workers) as parallel:
+            parallel.query(positions, sensors)  # so every thread has its scratch
+            start = time.perf_counter()
+            for _ in range(repeats):
+                parallel.query(positions, sensors)
+            duration = (time.perf_counter() - start) / repeats
+        single = single or duration
+        print(f"{workers}\t\t\t\t{round(duration * 1000, 4)}\t\t\t\t{round(single / duration, 2)}")
+
+
 def main():
+    if "--check" in sys.argv:
+        check_variants()
+        return
+    if "--memory" in sys.argv:
+        benchmark_memory()
+        return
+    if "--scaling" in sys.argv:
+        benchmark_scaling()
+        return
+
     positions = numpy.multiply(numpy.random.rand(500, 3), numpy.array([1920, 1080, 2 * pi]))
     sensors = numpy.multiply(numpy.random.rand(500, 5), numpy.array([1920, 1080, 2 * pi, 100, 2 * pi]))
 
@@ -212,6 +657,11 @@ def main():
     benchmark(get_visible_numpy_early_exit, positions, sensors)
     benchmark(get_visible_numpy_optimized, positions, sensors)
     benchmark(get_visible_numpy_optimized_2, positions, sensors)
+    benchmark(get_visible_grid, positions, sensors)
+    benchmark(get_visible_numpy, positions, sensors, sparse=True)
+    benchmark(get_visible_grid, positions, sensors, sparse=True)
+    benchmark(get_visible_tiled, positions, sensors, sparse=True)
+    benchmark(get_visible_parallel, positions, sensors, sparse=True)
     #benchmark(get_visible_naive_jit, positions, sensors)
     #benchmark(get_visible_naive_no_sqrt_jit, positions, sensors)
 
@@ -0,0 +1,5 @@
+from numpy_vectorization import check_variants
+
+
+def test_variants_agree():
+    check_variants(trials=20)
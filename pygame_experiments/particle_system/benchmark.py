@@ -0,0 +1,166 @@
+# headless benchmarks for the particle system - run from this directory with the repository root on the python path
+#
+#   python benchmark.py --rates 1000 5000 20000 --output results.json
+#   python benchmark.py --compare old.json results.json
+#
+# the SDL dummy video driver is used and everything is drawn to an offscreen Surface, so no window is opened
+import os
+
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+
+import argparse
+import json
+import platform
+import subprocess
+import time
+import tracemalloc
+
+import numpy
+import pygame
+
+from particles import ParticleSystemPoint
+
+
+WIDTH, HEIGHT = 600, 600
+DT = 1 / 60
+
+
+def make_emitter(screen, rate, backend="array", seed=0):
+    return ParticleSystemPoint(screen,
+                               position=((WIDTH // 2, HEIGHT // 2), (WIDTH // 4, HEIGHT // 4), 100),
+                               speed=(20,),
+                               direction=(90, 180, 720),
+                               rate=(rate,),
+                               duration=(0.5,),
+                               colour=((230, 100, 21), (20, 20, 20)),
+                               size=((7, 4),),
+                               backend=backend,
+                               capacity=rate,
+                               seed=seed)
+
+
+def run_frames(emitter, screen, frames):
+    """runs frames fixed steps of emitting, updating and drawing, returning per frame update and draw times in ms and
+    the peak number of live particles"""
+    update_times, draw_times = [], []
+    peak_particles = 0
+    for _ in range(frames):
+        start = time.perf_counter()
+        emitter.emit(DT)
+        emitter.advance(DT)
+        middle = time.perf_counter()
+        screen.fill((0, 0, 0))
+        emitter.draw()
+        end = time.perf_counter()
+
+        update_times.append((middle - start) * 1000)
+        draw_times.append((end - middle) * 1000)
+        peak_particles = max(peak_particles, emitter.total_particles)
+    return update_times, draw_times, peak_particles
+
+
+def summarise(times):
+    times = sorted(times)
+    return {"mean": sum(times) / len(times), "median": times[len(times) // 2], "max": times[-1]}
+
+
+def benchmark_emitter(rate, backend="array", draw_mode="gfxdraw", frames=300, seed=0):
+    """times an emitter at a constant emission rate, then repeats the run under tracemalloc to count allocations -
+    tracing slows every allocation down, so it is kept out of the timed run"""
+    screen = pygame.Surface((WIDTH, HEIGHT))
+
+    emitter = make_emitter(screen, rate, backend, seed)
+    emitter.set_draw_mode(draw_mode)
+    update_times, draw_times, peak_particles = run_frames(emitter, screen, frames)
+
+    emitter = make_emitter(screen, rate, backend, seed)
+    emitter.set_draw_mode(draw_mode)
+    tracemalloc.start()
+    run_frames(emitter, screen, frames)
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return {"rate": rate,
+            "backend": backend,
+            "draw_mode": draw_mode,
+            "frames": frames,
+            "update_ms": summarise(update_times),
+            "draw_ms": summarise(draw_times),
+            "allocated_bytes": current,
+            "peak_allocated_bytes": peak,
+            "peak_particles": peak_particles}
+
+
+def get_revision():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(old_path, new_path):
+    """prints the change in mean update and draw time for every configuration present in both result files"""
+    with open(old_path) as file:
+        old = json.load(file)
+    with open(new_path) as file:
+        new = json.load(file)
+
+    def key(result):
+        return result["rate"], result["backend"], result["draw_mode"]
+
+    old_results = {key(result): result for result in old["results"]}
+    print(f"{old['revision']} -> {new['revision']}")
+    print("rate\t\tbackend\t\tdraw mode\t\tupdate ms\t\t\tdraw ms")
+    for result in new["results"]:
+        previous = old_results.get(key(result))
+        if previous is None:
+            continue
+        changes = []
+        for measure in ("update_ms", "draw_ms"):
+            before, after = previous[measure]["mean"], result[measure]["mean"]
+            changes.append(f"{before:.3f} -> {after:.3f} ({(after / before - 1) * 100:+.1f}%)")
+        print(f"{result['rate']}\t\t{result['backend']}\t\t{result['draw_mode']}\t\t\t" + "\t\t".join(changes))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="headless particle system benchmarks")
+    parser.add_argument("--rates", type=int, nargs="+", default=[1000, 5000, 20000])
+    parser.add_argument("--backends", nargs="+", default=list(ParticleSystemPoint.BACKENDS),
+                        choices=ParticleSystemPoint.BACKENDS)
+    parser.add_argument("--draw-modes", nargs="+", default=list(ParticleSystemPoint.DRAW_MODES),
+                        choices=ParticleSystemPoint.DRAW_MODES)
+    parser.add_argument("--frames", type=int, default=300)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="json file to write the results to")
+    parser.add_argument("--compare", nargs=2, metavar=("OLD", "NEW"), help="compare two result files and exit")
+    args = parser.parse_args()
+
+    if args.compare:
+        compare(*args.compare)
+        return
+
+    pygame.init()
+    results = []
+    for rate in args.rates:
+        for backend in args.backends:
+            for draw_mode in args.draw_modes:
+                result = benchmark_emitter(rate, backend, draw_mode, args.frames, args.seed)
+                results.append(result)
+                print(f"rate {rate}, {backend}, {draw_mode}: update {result['update_ms']['mean']:.3f} ms, "
+                      f"draw {result['draw_ms']['mean']:.3f} ms, peak {result['peak_particles']} particles, "
+                      f"{result['peak_allocated_bytes'] / 1024:.1f} KiB peak allocated")
+    pygame.quit()
+
+    if args.output:
+        with open(args.output, "w") as file:
+            json.dump({"revision": get_revision(),
+                       "python": platform.python_version(),
+                       "numpy": numpy.__version__,
+                       "pygame": pygame.version.ver,
+                       "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+                       "results": results}, file, indent=4)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,134 @@
+import copy
+import multiprocessing
+import random
+from multiprocessing import shared_memory
+
+import numpy
+
+from particle_array import ParticleArray
+
+
+# attributes of a system the main process may change between steps (eg moving an emitter to the mouse) - any that have
+# changed are sent to the worker simulating it before each step
+PARAMETERS = ("position", "direction", "speed", "rate", "duration", "size", "colour", "offset", "emitting",
+              "kill_on_exit")
+
+
+def _worker(connection, systems, buffer_names):
+    """simulates a subset of the pool's systems, each one's particles living in its own shared memory block"""
+    memories = [shared_memory.SharedMemory(name=name) for name in buffer_names]
+    for system, memory in zip(systems, memories):
+        system.particle_array = ParticleArray(system.capacity, memory.buf)
+        system.set_curves(system.size_curve, system.position_curve)
+
+    try:
+        while True:
+            message = connection.recv()
+            if message is None:
+                break
+
+            dt, parameters = message
+            for system, values in zip(systems, parameters):
+                system.__dict__.update(values)
+                system.step(dt)
+                system.particle_array.publish()
+            connection.send(True)
+    finally:
+        for system in systems:
+            system.particle_array = None  # drop the views before closing the memory they point into
+        for memory in memories:
+            memory.close()
+
+
+class EmitterPool:
+    """steps independent array backend particle systems in a pool of worker processes.
+
+    each system's particles live in a shared memory block - a worker moves, ages and emits them, and the main process
+    only reads the same memory to draw, so nothing is copied between processes but each system's parameters. systems
+    are handed out round robin, and every system gets its own seed spawned from `seed`, so a run gives the same
+    particles whatever the number of workers. only the parameters that have changed since the last step are sent.
+
+    the pool has the same step and draw methods as a system, so it can be added to a FixedTimestepScheduler in place of
+    the systems it contains"""
+
+    def __init__(self, systems, workers: int = None, seed: int = None):
+        if any(system.backend != "array" for system in systems):
+            raise ValueError("only array backend particle systems can be simulated in an emitter pool")
+
+        self.systems = list(systems)
+        workers = min(workers or multiprocessing.cpu_count(), len(self.systems))
+
+        for system, sequence in zip(self.systems, numpy.random.SeedSequence(seed).spawn(len(self.systems))):
+            system.rng = numpy.random.default_rng(sequence)
+            system.random = random.Random(int(sequence.generate_state(1)[0]))
+
+        self.memories = []
+        for system in self.systems:
+            system.capacity = system.particle_array.capacity
+            memory = shared_memory.SharedMemory(create=True, size=ParticleArray.get_buffer_size(system.capacity))
+            self.memories.append(memory)
+            system.particle_array = ParticleArray(system.capacity, memory.buf)
+            system.set_curves(system.size_curve, system.position_curve)
+
+        # what each worker's copy of each system's parameters currently holds
+        self.sent = [copy.deepcopy({name: getattr(system, name) for name in PARAMETERS}) for system in self.systems]
+
+        self.assignments = [list(range(worker, len(self.systems), workers)) for worker in range(workers)]
+        self.connections = []
+        self.processes = []
+        for indices in self.assignments:
+            connection, worker_connection = multiprocessing.Pipe()
+            process = multiprocessing.Process(target=_worker,
+                                              args=(worker_connection,
+                                                    [self.systems[i] for i in indices],
+                                                    [self.memories[i].name for i in indices]),
+                                              daemon=True)
+            process.start()
+            self.connections.append(connection)
+            self.processes.append(process)
+
+    def step(self, dt: float):
+        """steps every system by dt seconds, with all workers running at once, and waits for them to finish"""
+        for connection, indices in zip(self.connections, self.assignments):
+            connection.send((dt, [self.get_changed_parameters(i) for i in indices]))
+
+        for connection in self.connections:
+            connection.recv()
+
+        for system in self.systems:
+            system.particle_array.load()
+            system.total_particles = len(system.particle_array)
+
+    def get_changed_parameters(self, index: int) -> dict:
+        """the parameters of a system that differ from those last sent to its worker"""
+        system, sent = self.systems[index], self.sent[index]
+        changed = {name: getattr(system, name) for name in PARAMETERS if getattr(system, name) != sent[name]}
+        sent.update(copy.deepcopy(changed))
+        return changed
+
+    def draw(self, alpha: float = 1):
+        for system in self.systems:
+            system.draw(alpha)
+
+    def close(self):
+        """stops the workers and frees the shared memory. the systems are left empty, but can carry on being used on
+        their own"""
+        for connection in self.connections:
+            connection.send(None)
+        for process in self.processes:
+            process.join()
+
+        for system in self.systems:
+            system.particle_array = ParticleArray(system.capacity)
+            system.set_curves(system.size_curve, system.position_curve)
+            system.total_particles = 0
+        for memory in self.memories:
+            memory.close()
+            memory.unlink()
+        self.memories = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
@@ -0,0 +1,330 @@
+import numpy
+
+
+def outside_rect(rect, positions: numpy.ndarray, sizes: numpy.ndarray) -> numpy.ndarray:
+    """returns a boolean mask of the circles (positions and radii) that do not overlap rect (anything with left, top,
+    right and bottom attributes, eg a pygame.Rect)"""
+    radius = numpy.abs(sizes)
+    x, y = positions[:, 0], positions[:, 1]
+    return ((x + radius < rect.left) | (x - radius > rect.right) |
+            (y + radius < rect.top) | (y - radius > rect.bottom))
+
+
+class ParticleArray:
+    """structure-of-arrays particle storage - every attribute of every particle lives in one preallocated numpy array,
+    so a frame of movement, shrinking, ageing and expiry is a handful of vectorized operations rather than a python call
+    per particle. live particles are always packed into the first `count` rows
+
+    particles are referred to by handles, which stay valid for the particle's whole life even as its row moves. dead
+    particles are only flagged when killed, and removed in one sweep per frame by moving live particles from the end of
+    the arrays into the holes (swap with last). handles of dead particles go onto a free-list to be reused, so after
+    the arrays have grown to the peak particle count no more memory is allocated
+
+    a bounding box around all live particles is kept up to date without looking at every particle - each update
+    moves its edges by the smallest and largest step of any particle, and spawning grows it to fit the new particles.
+    as the box only ever grows between spawns it is recalculated exactly every BOUNDS_REFRESH updates
+
+    sizes and positions normally change linearly with age. if size_curve or position_curve is set to a Curve they are
+    instead placed along the particle's path from its start to end size or position by looking up the curve at the
+    particle's normalized age"""
+
+    BOUNDS_REFRESH = 30
+
+    # per particle arrays as (name, columns, dtype), in the order they are laid out in a shared buffer
+    ATTRIBUTES = (("position", 2, numpy.float32),
+                  ("previous_position", 2, numpy.float32),  # position before the last update
+                  ("origin", 2, numpy.float32),  # position when emitted
+                  ("step", 2, numpy.float32),  # position change per second
+                  ("size", 1, numpy.float32),
+                  ("start_size", 1, numpy.float32),
+                  ("size_step", 1, numpy.float32),  # size change per second
+                  ("age", 1, numpy.float32),
+                  ("duration", 1, numpy.float32),
+                  ("colour", 3, numpy.uint8))
+    HEADER_SIZE = 6  # count, bounds and max radius, published for readers of a shared buffer
+
+    def __init__(self, capacity: int = 10000, buffer=None):
+        """if a buffer (eg a multiprocessing.shared_memory.SharedMemory's buf) is given the per particle arrays are
+        laid out in it rather than allocated, so other processes can map the same particles. a buffered array cannot
+        grow, particles spawned beyond its capacity are dropped"""
+        self.buffer = buffer
+        self.capacity = 0
+        self.count = 0
+        self.free_count = 0
+        self.header = numpy.zeros(self.HEADER_SIZE) if buffer is None else \
+            numpy.ndarray(self.HEADER_SIZE, numpy.float64, buffer=buffer)
+        self._allocate(capacity)
+
+        self.bounds = numpy.zeros(4)  # left, top, right, bottom of the particle positions
+        self.step_bounds = numpy.zeros(4)  # smallest x and y steps, then largest x and y steps
+        self.max_radius = 0
+        self.updates_since_refresh = 0
+        self.reset_bounds()
+
+        self.size_curve = None
+        self.position_curve = None
+
+    @classmethod
+    def get_buffer_size(cls, capacity: int) -> int:
+        """bytes of buffer needed to hold `capacity` particles"""
+        return cls.HEADER_SIZE * 8 + sum(capacity * columns * numpy.dtype(dtype).itemsize
+                                         for _, columns, dtype in cls.ATTRIBUTES)
+
+    def _allocate(self, capacity: int):
+        """(re)allocates every array with room for `capacity` particles, keeping the live ones and their handles"""
+        if self.buffer is not None and self.capacity:
+            raise MemoryError("a particle array in a shared buffer cannot grow")
+
+        old = self.capacity and self._arrays() + (self.slot_handle, self.handle_slot, self.free_handles)
+
+        offset = self.HEADER_SIZE * 8
+        for name, columns, dtype in self.ATTRIBUTES:
+            shape = (capacity, columns) if columns > 1 else (capacity,)
+            if self.buffer is None:
+                array = numpy.zeros(shape, dtype=dtype)
+            else:
+                array = numpy.ndarray(shape, dtype, buffer=self.buffer, offset=offset)
+                offset += array.nbytes
+            setattr(self, name, array)
+
+        self.dead = numpy.zeros(capacity, dtype=bool)  # per slot, flags particles to be removed by the next sweep
+        self.slot_handle = numpy.zeros(capacity, dtype=numpy.int32)
+        self.handle_slot = numpy.full(capacity, -1, dtype=numpy.int32)
+        self.free_handles = numpy.zeros(capacity, dtype=numpy.int32)  # stack, top is free_handles[free_count - 1]
+
+        self._scratch = numpy.zeros((capacity, 2), dtype=numpy.float32)
+        self._progress = numpy.zeros(capacity, dtype=numpy.float32)
+        self._expired = numpy.zeros(capacity, dtype=bool)
+
+        if old:
+            *old_arrays, old_slot_handle, old_handle_slot, old_free_handles = old
+            for old_array, new_array in zip(old_arrays, self._arrays()):
+                new_array[:self.count] = old_array[:self.count]
+            self.slot_handle[:self.count] = old_slot_handle[:self.count]
+            self.handle_slot[:self.capacity] = old_handle_slot
+            self.free_handles[:self.free_count] = old_free_handles[:self.free_count]
+
+        # new handles are pushed in reverse so the lowest is handed out first
+        new_handles = numpy.arange(capacity - 1, self.capacity - 1, -1, dtype=numpy.int32)
+        self.free_handles[self.free_count:self.free_count + len(new_handles)] = new_handles
+        self.free_count += len(new_handles)
+
+        self.capacity = capacity
+
+    def _arrays(self):
+        return tuple(getattr(self, name) for name, _, _ in self.ATTRIBUTES)
+
+    def __len__(self):
+        return self.count
+
+    def spawn(self, position, step, size, size_step, duration, colour, age=0) -> numpy.ndarray:
+        """appends a batch of particles, each argument being an array with one row per particle (or a scalar shared by
+        all of them). particles with a non-zero age are advanced by that age so emission is spread across the frame.
+        returns the handles of the new particles"""
+        n = len(position)
+        if self.count + n > self.capacity:
+            if self.buffer is None:
+                self._allocate(max(self.capacity * 2, self.count + n))
+            else:
+                n = self.capacity - self.count
+                position, step, size, size_step, duration, colour, age = (
+                    value[:n] if numpy.ndim(value) and len(value) == len(position) else value
+                    for value in (position, step, size, size_step, duration, colour, age))
+
+        if n == 0:
+            return self.free_handles[:0].copy()
+
+        new = slice(self.count, self.count + n)
+        self.position[new] = position
+        self.step[new] = step
+        self.size[new] = size
+        self.size_step[new] = size_step
+        self.age[new] = age
+        self.duration[new] = duration
+        self.colour[new] = numpy.clip(colour, 0, 255)
+
+        self.origin[new] = self.position[new]
+        self.start_size[new] = self.size[new]
+        if self.position_curve is None:
+            self.position[new] += self.step[new] * self.age[new, numpy.newaxis]
+        if self.size_curve is None:
+            self.size[new] += self.size_step[new] * self.age[new]
+        self.apply_curves(new)
+        self.previous_position[new] = self.position[new]
+        self.grow_bounds(new)
+
+        handles = self.free_handles[self.free_count - n:self.free_count][::-1].copy()
+        self.free_count -= n
+        self.slot_handle[new] = handles
+        self.handle_slot[handles] = numpy.arange(self.count, self.count + n, dtype=numpy.int32)
+
+        self.count += n
+        return handles
+
+    def update(self, dt: float):
+        """advances every live particle by dt seconds, then removes the ones that have outlived their duration"""
+        live = slice(0, self.count)
+        scratch = self._scratch[live]
+
+        self.previous_position[live] = self.position[live]
+        self.age[live] += dt
+        if self.position_curve is None:
+            numpy.multiply(self.step[live], dt, out=scratch)
+            self.position[live] += scratch
+        if self.size_curve is None:
+            numpy.multiply(self.size_step[live], dt, out=scratch[:, 0])
+            self.size[live] += scratch[:, 0]
+        self.apply_curves(live)
+
+        numpy.greater(self.age[live], self.duration[live], out=self._expired[live])
+        self.dead[live] |= self._expired[live]
+
+        self.sweep()
+
+        if self.position_curve is None:
+            self.bounds[:2] += self.step_bounds[:2] * dt
+            self.bounds[2:] += self.step_bounds[2:] * dt
+        self.updates_since_refresh += 1
+        if self.count == 0:
+            self.reset_bounds()
+        elif self.updates_since_refresh >= self.BOUNDS_REFRESH:
+            self.refresh_bounds()
+
+    def apply_curves(self, rows: slice):
+        """sets the size and position of the particles in rows from the curves at their current age"""
+        if self.size_curve is None and self.position_curve is None:
+            return
+
+        progress = self._progress[rows]  # normalized age
+        numpy.divide(self.age[rows], self.duration[rows], out=progress)
+
+        if self.size_curve is not None:
+            eased = self._scratch[rows, 0]
+            self.size_curve.sample(progress, out=eased)
+            eased *= self.duration[rows]  # seconds of linear change, so a linear curve matches having no curve
+            numpy.multiply(self.size_step[rows], eased, out=self.size[rows])
+            self.size[rows] += self.start_size[rows]
+
+        if self.position_curve is not None:
+            eased = self._scratch[rows, 0]
+            self.position_curve.sample(progress, out=eased)
+            eased *= self.duration[rows]
+            numpy.multiply(self.step[rows], eased[:, numpy.newaxis], out=self.position[rows])
+            self.position[rows] += self.origin[rows]
+
+    def reset_bounds(self):
+        self.bounds[:2] = self.step_bounds[:2] = numpy.inf
+        self.bounds[2:] = self.step_bounds[2:] = -numpy.inf
+        self.max_radius = 0
+        self.updates_since_refresh = 0
+
+    def grow_bounds(self, rows: slice):
+        """expands the bounding box, step bounds and largest radius to include the particles in rows"""
+        position, step = self.position[rows], self.step[rows]
+        if self.position_curve is None:
+            low, high = position, position
+            self.step_bounds[:2] = numpy.minimum(self.step_bounds[:2], step.min(axis=0))
+            self.step_bounds[2:] = numpy.maximum(self.step_bounds[2:], step.max(axis=0))
+        else:
+            # particles stay between the furthest back and furthest along the curve takes them
+            path = step * self.duration[rows, numpy.newaxis]
+            low = self.origin[rows] + numpy.minimum(path * self.position_curve.min, path * self.position_curve.max)
+            high = self.origin[rows] + numpy.maximum(path * self.position_curve.min, path * self.position_curve.max)
+        self.bounds[:2] = numpy.minimum(self.bounds[:2], low.min(axis=0))
+        self.bounds[2:] = numpy.maximum(self.bounds[2:], high.max(axis=0))
+
+        change = self.size_step[rows] * self.duration[rows]
+        if self.size_curve is None:
+            end_size = self.size[rows] + self.size_step[rows] * (self.duration[rows] - self.age[rows])
+            sizes = (self.size[rows], end_size)
+        else:
+            sizes = (self.start_size[rows] + change * self.size_curve.min,
+                     self.start_size[rows] + change * self.size_curve.max)
+        self.max_radius = max(self.max_radius, *(float(numpy.abs(size).max()) for size in sizes))
+
+    def refresh_bounds(self):
+        """recalculates the bounding box exactly from the live particles"""
+        self.reset_bounds()
+        if self.count:
+            self.grow_bounds(slice(0, self.count))
+
+    def get_bounds(self):
+        """left, top, right and bottom edges of a box containing every live particle, including its radius"""
+        left, top, right, bottom = self.bounds.tolist()
+        return left - self.max_radius, top - self.max_radius, right + self.max_radius, bottom + self.max_radius
+
+    def outside(self, rect, positions: numpy.ndarray = None) -> numpy.ndarray:
+        """returns a boolean mask of the live particles that do not overlap rect (anything with left, top, right and
+        bottom attributes, eg a pygame.Rect). positions overrides the particles' current positions, eg when drawing
+        interpolated positions"""
+        if positions is None:
+            positions = self.position[:self.count]
+        return outside_rect(rect, positions, self.size[:self.count])
+
+    def get_positions(self, alpha: float = 1) -> numpy.ndarray:
+        """positions of the live particles, alpha of the way between their positions before and after the last update"""
+        if alpha == 1:
+            return self.position[:self.count]
+        previous = self.previous_position[:self.count]
+        return previous + (self.position[:self.count] - previous) * alpha
+
+    def kill(self, handles):
+        """flags the particles with the given handles to be removed by the next sweep"""
+        slots = self.handle_slot[handles]
+        self.dead[slots[slots >= 0]] = True
+
+    def kill_where(self, mask: numpy.ndarray):
+        """flags the live particles selected by a boolean mask (one entry per live particle) for the next sweep"""
+        self.dead[:self.count] |= mask
+
+    def is_alive(self, handle: int) -> bool:
+        slot = self.handle_slot[handle]
+        return slot >= 0 and not self.dead[slot]
+
+    def get_slot(self, handle: int) -> int:
+        """returns the row currently holding the particle with this handle, or -1 if it has been removed. rows change
+        whenever a sweep removes particles, handles do not"""
+        return int(self.handle_slot[handle])
+
+    def sweep(self):
+        """removes every flagged particle, filling the holes they leave below the new count with the live particles
+        above it. only the k removed particles are touched beyond the single pass that finds them"""
+        dead = self.dead[:self.count]
+        dead_slots = numpy.flatnonzero(dead)
+        k = len(dead_slots)
+        if k == 0:
+            return
+
+        new_count = self.count - k
+        holes = dead_slots[:numpy.searchsorted(dead_slots, new_count)]
+        fillers = new_count + numpy.flatnonzero(~dead[new_count:])
+
+        dead_handles = self.slot_handle[dead_slots]
+        self.handle_slot[dead_handles] = -1
+        self.free_handles[self.free_count:self.free_count + k] = dead_handles
+        self.free_count += k
+
+        for array in self._arrays():
+            array[holes] = array[fillers]
+        self.slot_handle[holes] = self.slot_handle[fillers]
+        self.handle_slot[self.slot_handle[holes]] = holes
+
+        dead[:] = False
+        self.count = new_count
+
+    def publish(self):
+        """writes the count and bounds to the header, for other processes sharing the buffer to load"""
+        self.header[0] = self.count
+        self.header[1:5] = self.bounds
+        self.header[5] = self.max_radius
+
+    def load(self):
+        """reads the count and bounds published by the process updating a shared buffer"""
+        self.count = int(self.header[0])
+        self.bounds[:] = self.header[1:5]
+        self.max_radius = float(self.header[5])
+
+    def clear(self):
+        self.kill(self.slot_handle[:self.count])
+        self.sweep()
+        self.reset_bounds()
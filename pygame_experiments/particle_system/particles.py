@@ -1,10 +1,16 @@
-from pygame import Vector2, draw, gfxdraw, Surface
+from pygame import Vector2, draw, gfxdraw, Surface, Rect
 import time
 from typing import List, Union, Tuple
 import random
 import math
 
+import numpy
+
 from utilities.vector import Vector
+from particle_array import ParticleArray, outside_rect
+from particle_renderer import ParticleRenderer
+from scheduler import FixedTimestepScheduler
+from curves import Curve
 
 
 class Particle:
@@ -25,46 +31,63 @@ class Particle:
         self.position = position
         self.direction = direction
         self.speed = speed
-        self.active_frames = duration * fps
         self.size_max = size_max
         self.size_min = size_min
         self.colour = colour
         self.offset = offset
 
         self.size = size_max
-        self.age = age
-        self.updates = 0
+        self.age = 0
+        self.duration = duration
+        self.fps = fps
+        self.alive = True
 
 
         self.direction_vector = Vector2()
         self.direction_vector.from_polar((speed, direction))
 
-        self.size_function = lambda x: x
-        self.position_function = lambda x: x
+        self.origin = Vector2(position)
+
+        # changes per second, scaled by the time step in update
+        self.position_step = self.direction_vector * speed
+        self.size_step = (size_min - size_max) / duration
 
-        self.position_step = self.direction_vector * speed * (1 / fps)
-        self.size_step = (size_min - size_max) / duration * (1 / fps)
+        if age > 0:
+            self.update(age)
 
-        if self.age > 0:
-            self.updates -= 1
-            self.update()
+    def update(self, dt: float = None, view: Rect = None):
+        """advances the particle by dt seconds, or by one frame at the particle's fps if dt is not given. view is the
+        owner's view for kill_on_exit, looked up if not given"""
+        if dt is None:
+            dt = 1 / self.fps
 
-    def update(self):
-        if self.updates > self.active_frames:
+        if self.age > self.duration or (self.owner.kill_on_exit and
+                                        not self.owner.in_view(self.position, self.size, view)):
             self.kill()
+            return
+
+        self.age += dt
 
-        self.position += self.position_step
-        self.size += self.size_step
-        self.updates += 1
+        position_curve, size_curve = self.owner.position_curve, self.owner.size_curve
+        t = self.age / self.duration
+        if position_curve is None:
+            self.position += self.position_step * dt
+        else:
+            self.position = self.origin + self.position_step * (self.duration * position_curve(t))
+        if size_curve is None:
+            self.size += self.size_step * dt
+        else:
+            self.size = self.size_max + self.size_step * (self.duration * size_curve(t))
+
+    def draw(self, view: Rect = None):
+        if not self.owner.in_view(self.position, self.size, view):
+            return
 
-    def draw(self):
         screen = self.owner.get_screen()
         mode = self.owner.get_draw_mode()
 
-        size = self.size_function(self.size)
-
         if mode == "gfxdraw":
-            gfxdraw.circle(screen, int(self.position[0]), int(self.position[1]), int(size), self.colour)
+            gfxdraw.circle(screen, int(self.position[0]), int(self.position[1]), int(self.size), self.colour)
         elif mode == "draw":
             draw.circle(screen, self.colour, self.position, int(self.size))
 
@@ -74,6 +97,9 @@ class Particle:
 
 class ParticleSystemPoint:
     MAX_VELOCITIES = 100
+    BACKENDS = ("object", "array")
+    DRAW_MODES = ("gfxdraw", "draw", "blits")
+    MAX_EMIT_INTERVAL = 1 / 20  # longest gap emit() will fill when timing itself, so pauses don't cause bursts
     DEFAULTS = {
         "position": ((0, 0), (0, 0), 100),
         "direction": (0, 360, 720),
@@ -94,7 +120,13 @@ class ParticleSystemPoint:
                  duration: Tuple[Union[float, int]] = (),
                  size: Tuple[Union[float, int]] = (),
                  colour: Tuple[Union[Tuple, float]] = (),
-                 offset: Tuple[Union[float, int]] = ()):
+                 offset: Tuple[Union[float, int]] = (),
+                 backend: str = "object",
+                 capacity: int = 10000,
+                 seed: int = None,
+                 kill_on_exit: bool = False,
+                 size_curve=None,
+                 position_curve=None):
 
         def fill_defaults(specified: Tuple, name: str):
             n_args = len(specified)
@@ -110,11 +142,27 @@ class ParticleSystemPoint:
         self.colour = fill_defaults(colour, "colour")
         self.offset = fill_defaults(offset, "offset")
         self.draw_mode = "gfxdraw"
+        self.renderer = ParticleRenderer()
+
+        if backend not in self.BACKENDS:
+            raise ValueError(f"{backend} not a supported backend")
+        self.backend = backend
+
+        self.seed = seed
+        self.random = random.Random(seed)
+        self.rng = numpy.random.default_rng(seed)
 
         self.start_time = None
         self.previous_emit_time = None
+        self.emit_remainder = 0  # fraction of the next particle accumulated by previous emits
+        self.emitting = False  # whether a scheduler emits from this system each step
+        self.kill_on_exit = kill_on_exit  # remove particles as soon as they leave the screen
 
         self.particles = []
+        self.dead_particles = 0
+        self.capacity = capacity
+        self.particle_array = ParticleArray(capacity) if backend == "array" else None
+        self.set_curves(size_curve, position_curve)
         self.total_particles = 0
 
         self.velocities = []
@@ -126,24 +174,88 @@ class ParticleSystemPoint:
     def get_draw_mode(self):
         return self.draw_mode
 
+    def get_view(self):
+        if self.screen is None:
+            return Rect(self.view)
+        return self.screen.get_rect()
+
+    def __getstate__(self):
+        """pickles everything needed to simulate the system in another process - the screen and renderer can't be
+        pickled, so only the size of the screen is kept, and the particles themselves are left behind"""
+        state = self.__dict__.copy()
+        state["view"] = tuple(self.get_view())
+        state["screen"] = None
+        state["renderer"] = None
+        state["particles"] = []
+        state["particle_array"] = None
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.renderer = ParticleRenderer()
+
+    def in_view(self, position, size: float, view: Rect = None) -> bool:
+        """whether a circle of the given size at position overlaps the view, which is looked up if not given - pass
+        it in when testing many particles in one frame"""
+        if view is None:
+            view = self.get_view()
+        size = abs(size)
+        return (view.left - size <= position[0] <= view.right + size and
+                view.top - size <= position[1] <= view.bottom + size)
+
+    def is_visible(self) -> bool:
+        """whether any particle may be on the screen. only the array backend tracks its particles' bounds, so object
+        backend systems are always assumed to be visible"""
+        if self.backend != "array":
+            return True
+        if len(self.particle_array) == 0:
+            return False
+
+        left, top, right, bottom = self.particle_array.get_bounds()
+        view = self.get_view()
+        return left <= view.right and right >= view.left and top <= view.bottom and bottom >= view.top
+
+    def set_draw_mode(self, mode: str):
+        if mode not in self.DRAW_MODES:
+            raise ValueError(f"{mode} not a supported draw mode")
+        self.draw_mode = mode
+
+    def set_curves(self, size_curve=None, position_curve=None):
+        """eases particles' size and movement over their lives. each curve maps a particle's normalized age (0 to 1) to
+        how far it is from its start to its end size, or along its path, with no curve meaning linear. curves can be
+        Curve objects or plain functions of t, which are baked into Curves"""
+        self.size_curve = Curve.from_function(size_curve)
+        self.position_curve = Curve.from_function(position_curve)
+        if self.particle_array is not None:
+            self.particle_array.size_curve = self.size_curve
+            self.particle_array.position_curve = self.position_curve
+
     def set_velocity(self, velocity: Tuple[int]):
         """Changes speed and direction using a velocity vector"""
         speed, direction = Vector2(*velocity).as_polar()
         self.speed = (speed,) + self.speed[1:]
         self.direction = (direction,) + self.direction[1:]
 
-    def emit(self) -> int:
-        if self.start_time is None:
-            self.start_time = self.previous_emit_time = time.time()
-            return 0
+    def emit(self, dt: float = None) -> int:
+        """emits rate * dt particles, spread evenly across the interval by pre-ageing them. any fraction of a particle
+        left over carries into the next call, so low rates and short steps still emit at the right average rate. if dt
+        is not given the time since the previous emit is measured. returns the number of particles emitted"""
+        if dt is None:
+            current_time = time.time()
+            if self.start_time is None:
+                self.start_time = self.previous_emit_time = current_time
+                return 0
 
-        current_time = time.time()
+            dt = min(current_time - self.previous_emit_time, self.MAX_EMIT_INTERVAL)
+            self.previous_emit_time = current_time
 
-        dT = (1/60) #current_time - self.previous_emit_time
-        n_particles = self.rate[0] * (1 / 60)  # dT
+        ages = self.get_emit_ages(dt)
 
-        t = 0
-        while t < dT:
+        if self.backend == "array":
+            self.emit_array(ages)
+            return len(ages)
+
+        for age in ages.tolist():
             p = Particle(self,
                          self.generate_position(),
                          self.generate_direction(),
@@ -153,26 +265,149 @@ class ParticleSystemPoint:
                          self.generate_size(False),
                          self.generate_colour(),
                          self.generate_offset(),
-                         age=dT - t)
+                         age=age)
 
             self.add_particle(p)
-            t += dT / n_particles
-
 
-        self.previous_emit_time = current_time
-
-    def update(self):
+        return len(ages)
+
+    def get_emit_ages(self, dt: float) -> numpy.ndarray:
+        """returns the age at the end of the interval of each particle emitted during it, one every 1 / rate seconds"""
+        rate = self.rate[0]
+        if rate <= 0:
+            return numpy.zeros(0)
+
+        remainder = self.emit_remainder
+        total = remainder + rate * dt
+        n = int(total)
+        self.emit_remainder = total - n
+
+        emit_times = (numpy.arange(n) + 1 - remainder) / rate
+        return numpy.maximum(dt - emit_times, 0)
+
+    def emit_array(self, ages: numpy.ndarray):
+        """array backend equivalent of the emit loop - every attribute of the particles is drawn in one batch, then
+        handed to the particle array in one call"""
+        n = len(ages)
+
+        positions = self.generate_positions(n)
+        directions = self.generate_directions(n)
+        speeds = self.generate_speeds(n)
+        durations = self.generate_durations(n)
+        sizes = self.generate_sizes(n)
+        sizes_max, sizes_min = sizes[:, 0], sizes[:, 1]
+        colours = self.generate_colours(n)
+
+        # Particle's direction_vector already has length speed before being scaled by speed again
+        radians = numpy.radians(directions)
+        steps = numpy.column_stack((numpy.cos(radians), numpy.sin(radians))) * (speeds ** 2)[:, numpy.newaxis]
+
+        handles = self.particle_array.spawn(positions,
+                                            steps,
+                                            sizes_max,
+                                            (sizes_min - sizes_max) / durations,
+                                            durations,
+                                            colours,
+                                            ages)
+        self.total_particles += len(handles)
+
+    def step(self, dt: float):
+        """advances the system by one simulation step of dt seconds, emitting during it if the system is emitting"""
+        self.advance(dt)
+        if self.emitting:
+            self.emit(dt)
+
+    def update(self, dt: float = 1 / 60):
+        self.advance(dt)
+        self.draw()
+
+    def advance(self, dt: float):
+        """moves, ages and expires every particle by dt seconds without drawing"""
+        if self.backend == "array":
+            self.particle_array.update(dt)
+            if self.kill_on_exit:
+                if not self.is_visible():
+                    self.particle_array.clear()
+                else:
+                    self.particle_array.kill_where(self.particle_array.outside(self.get_view()))
+                    self.particle_array.sweep()
+            self.total_particles = len(self.particle_array)
+            return
+
+        view = self.get_view() if self.kill_on_exit else None
+        for particle in self.particles:
+            particle.update(dt, view)
+
+        self.sweep()
+
+    def draw(self, alpha: float = 1):
+        """draws every particle. the array backend draws particles alpha of the way from their previous to their
+        current position, for interpolating between simulation steps"""
+        if self.backend == "array":
+            self.draw_array(alpha)
+            return
+
+        if self.draw_mode == "blits":
+            if self.particles:
+                positions = numpy.array([particle.position for particle in self.particles])
+                sizes = numpy.array([particle.size for particle in self.particles])
+                colours = numpy.array([particle.colour for particle in self.particles])
+                visible = ~outside_rect(self.get_view(), positions, sizes)
+                self.renderer.draw(self.screen, positions[visible], sizes[visible], colours[visible])
+            return
+
+        view = self.get_view()
         for particle in self.particles:
-            particle.update()
-            particle.draw()
+            particle.draw(view)
+
+    def draw_array(self, alpha: float = 1):
+        """draws the particles of the array backend, skipping the whole system if its bounds are off the screen and
+        only testing individual particles if the bounds cross the edge of it"""
+        if not self.is_visible():
+            return
+
+        n = len(self.particle_array)
+        positions = self.particle_array.get_positions(alpha)
+        sizes = self.particle_array.size[:n]
+        colours = self.particle_array.colour[:n]
+
+        left, top, right, bottom = self.particle_array.get_bounds()
+        view = self.get_view()
+        if left < view.left or top < view.top or right > view.right or bottom > view.bottom:
+            visible = ~self.particle_array.outside(view, positions)
+            positions, sizes, colours = positions[visible], sizes[visible], colours[visible]
+
+        if self.draw_mode == "blits":
+            self.renderer.draw(self.screen, positions, sizes, colours)
+            return
+
+        positions = positions.astype(int).tolist()
+        sizes = sizes.astype(int).tolist()
+        colours = colours.tolist()
+
+        if self.draw_mode == "gfxdraw":
+            for (x, y), size, colour in zip(positions, sizes, colours):
+                gfxdraw.circle(self.screen, x, y, size, colour)
+        elif self.draw_mode == "draw":
+            for position, size, colour in zip(positions, sizes, colours):
+                draw.circle(self.screen, colour, position, size)
 
     def add_particle(self, particle: Particle):
         self.particles.append(particle)
         self.total_particles += 1
 
     def remove_particle(self, particle: Particle):
-        self.particles.remove(particle)
-        self.total_particles -= 1
+        """flags the particle as dead, it stays in the list until the end of the frame's update"""
+        if particle.alive:
+            particle.alive = False
+            self.dead_particles += 1
+            self.total_particles -= 1
+
+    def sweep(self):
+        """drops every particle flagged by remove_particle in a single pass"""
+        if self.dead_particles:
+            self.particles = [particle for particle in self.particles if particle.alive]
+            self.dead_particles = 0
 
     def get_random_value(self, attr: str):
         if attr not in self.DEFAULTS:
@@ -185,8 +420,23 @@ class ParticleSystemPoint:
 
         #print(value, variance)
         if isinstance(value, tuple):
-            return tuple([v + int((random.random() - 0.5) * num_steps) / num_steps * variance[i] * 2 for i, v in enumerate(value)])
-        return value + int((random.random() - 0.5) * num_steps) / num_steps * variance * 2
+            return tuple([v + int((self.random.random() - 0.5) * num_steps) / num_steps * variance[i] * 2 for i, v in enumerate(value)])
+        return value + int((self.random.random() - 0.5) * num_steps) / num_steps * variance * 2
+
+    def get_random_values(self, attr: str, n: int) -> numpy.ndarray:
+        """batched get_random_value - returns n values of the attribute (one row per value for tuple attributes),
+        quantized to the same num_steps levels but drawn with a single call to the emitter's numpy generator"""
+        if attr not in self.DEFAULTS:
+            raise ValueError(f"{attr} not a supported attribute")
+
+        value, variance, num_steps = self.__getattribute__(attr)
+        value = numpy.asarray(value, dtype=float)
+
+        if num_steps == 0 or numpy.all(numpy.equal(variance, 0)):
+            return numpy.broadcast_to(value, (n,) + value.shape).copy()
+
+        steps = numpy.trunc((self.rng.random((n,) + value.shape) - 0.5) * num_steps)
+        return value + steps / num_steps * numpy.asarray(variance, dtype=float) * 2
 
     def generate_position(self):
         return Vector2(self.get_random_value("position"))
@@ -211,10 +461,121 @@ class ParticleSystemPoint:
     def generate_offset(self):
         return self.get_random_value("offset")
 
+    def generate_positions(self, n: int):
+        return self.get_random_values("position", n)
 
-class ParticleSystemPolygon:
-    def __init__(self, polygon: List[Vector2]):
-        pass
+    def generate_directions(self, n: int):
+        return self.get_random_values("direction", n)
+
+    def generate_speeds(self, n: int):
+        return self.get_random_values("speed", n)
+
+    def generate_durations(self, n: int):
+        return self.get_random_values("duration", n)
+
+    def generate_sizes(self, n: int):
+        """start sizes in column 0, end sizes in column 1"""
+        return self.get_random_values("size", n)
+
+    def generate_colours(self, n: int):
+        return self.get_random_values("colour", n)
+
+    def generate_offsets(self, n: int):
+        return self.get_random_values("offset", n)
+
+
+def cross(a: numpy.ndarray, b: numpy.ndarray):
+    """z component of the cross product of 2D vectors, or of each pair of rows of two (n, 2) arrays"""
+    return a[..., 0] * b[..., 1] - a[..., 1] * b[..., 0]
+
+
+class ParticleSystemPolygon(ParticleSystemPoint):
+    """emits particles spread uniformly along the edges of a polygon, or across its area. the polygon is relative to
+    the system's position, and particles otherwise behave exactly like a ParticleSystemPoint's.
+
+    sampling is weighted by edge length (or triangle area) through a cumulative table built once per polygon, so
+    placing a frame's particles is one searchsorted and some arithmetic however many there are"""
+    SAMPLE_MODES = ("edge", "area")
+
+    def __init__(self,
+                 screen: Surface,
+                 polygon: List[Vector2],
+                 sample_mode: str = "edge",
+                 **kwargs):
+        kwargs.setdefault("backend", "array")
+        super().__init__(screen, **kwargs)
+
+        if sample_mode not in self.SAMPLE_MODES:
+            raise ValueError(f"{sample_mode} not a supported sample mode")
+        self.sample_mode = sample_mode
+        self.set_polygon(polygon)
+
+    def set_polygon(self, polygon: List[Vector2]):
+        self.polygon = numpy.array([tuple(vertex) for vertex in polygon], dtype=float)
+        if len(self.polygon) < 3:
+            raise ValueError("a polygon needs at least 3 vertices")
+
+        self.edges = numpy.roll(self.polygon, -1, axis=0) - self.polygon
+        self.edge_lengths = numpy.hypot(self.edges[:, 0], self.edges[:, 1])
+        self.edge_cdf = numpy.cumsum(self.edge_lengths)
+
+        self.triangles = self.triangulate(self.polygon)
+        a, b, c = self.triangles[:, 0], self.triangles[:, 1], self.triangles[:, 2]
+        self.triangle_areas = numpy.abs(cross(b - a, c - a)) / 2
+        self.triangle_cdf = numpy.cumsum(self.triangle_areas)
+
+    @staticmethod
+    def triangulate(polygon: numpy.ndarray) -> numpy.ndarray:
+        """splits a simple polygon into triangles by ear clipping, returning an (n - 2, 3, 2) array of vertices"""
+        x, y = polygon[:, 0], polygon[:, 1]
+        clockwise = numpy.sum(x * numpy.roll(y, -1) - numpy.roll(x, -1) * y) < 0
+        remaining = list(range(len(polygon)))[::-1] if clockwise else list(range(len(polygon)))
+
+        def inside(p, a, b, c):
+            return (cross(b - a, p - a) >= 0 and cross(c - b, p - b) >= 0 and
+                    cross(a - c, p - c) >= 0)
+
+        triangles = []
+        while len(remaining) > 3:
+            n = len(remaining)
+            for i in range(n):
+                ia, ib, ic = remaining[i - 1], remaining[i], remaining[(i + 1) % n]
+                a, b, c = polygon[ia], polygon[ib], polygon[ic]
+                if cross(b - a, c - b) <= 0:
+                    continue  # reflex or collinear vertex
+                if any(inside(polygon[j], a, b, c) for j in remaining if j not in (ia, ib, ic)):
+                    continue
+                break
+            else:
+                i = 1  # only degenerate ears left, clip one anyway
+                ia, ib, ic = remaining[0], remaining[1], remaining[2 % n]
+
+            triangles.append((polygon[ia], polygon[ib], polygon[ic]))
+            remaining.pop(i)
+
+        triangles.append(tuple(polygon[j] for j in remaining))
+        return numpy.array(triangles)
+
+    def sample_points(self, n: int) -> numpy.ndarray:
+        """returns n points spread uniformly along the polygon's edges or over its area, relative to its position"""
+        if self.sample_mode == "edge":
+            distances = self.rng.random(n) * self.edge_cdf[-1]
+            edges = numpy.minimum(numpy.searchsorted(self.edge_cdf, distances, side="right"), len(self.edges) - 1)
+            t = (distances - (self.edge_cdf[edges] - self.edge_lengths[edges])) / self.edge_lengths[edges]
+            return self.polygon[edges] + self.edges[edges] * t[:, numpy.newaxis]
+
+        areas = self.rng.random(n) * self.triangle_cdf[-1]
+        triangles = self.triangles[numpy.minimum(numpy.searchsorted(self.triangle_cdf, areas, side="right"),
+                                                 len(self.triangles) - 1)]
+        r1, r2 = self.rng.random((2, n, 1))
+        s = numpy.sqrt(r1)
+        return (1 - s) * triangles[:, 0] + s * (1 - r2) * triangles[:, 1] + s * r2 * triangles[:, 2]
+
+    def generate_position(self):
+        return super().generate_position() + Vector2(*self.sample_points(1)[0])
+
+    def generate_positions(self, n: int):
+        return super().generate_positions(n) + self.sample_points(n)
 
 
 if __name__ == "__main__":
@@ -235,7 +596,10 @@ if __name__ == "__main__":
                             duration=(0.5,),
                             colour=((230, 100, 21), (20, 20, 20)),
                             size=((7, 4),),
+                            backend="array",
+                            capacity=100000,
                             )
+    p.set_draw_mode("blits")
 
     p3 = ParticleSystemPoint(screen,
                              speed=(17,),
@@ -243,7 +607,8 @@ if __name__ == "__main__":
                              rate=(2000,),
                              duration=(0.2,),
                              colour=((120, 120, 230), (20, 20, 20)),
-                             size=((7, 4),))
+                             size=((7, 4),),
+                             size_curve=lambda t: fade_in_out(t, 0, 1))
 
     p2 = ParticleSystemPoint(screen,
                              rate=(1,))
@@ -259,6 +624,10 @@ if __name__ == "__main__":
     print(f"offset: {p.generate_offset()}")
     print(vars(p))
 
+    scheduler = FixedTimestepScheduler()
+    for system in (p, p2, p3):
+        scheduler.add(system)
+
     clock = pygame.time.Clock()
     previous_mouse_pos = pygame.mouse.get_pos()
     mouse_vel = (0, 0)
@@ -278,23 +647,22 @@ if __name__ == "__main__":
                 running = False
                 break
 
-        if pygame.mouse.get_pressed()[0]:
+        pressed = pygame.mouse.get_pressed()
+        p.emitting, p2.emitting, p3.emitting = pressed
+
+        if p.emitting:
             p.position = (pygame.mouse.get_pos(), 0, 0)
             p.set_velocity(new_vel)
-            p.emit()
 
-        if pygame.mouse.get_pressed()[1]:
+        if p2.emitting:
             p2.position = (pygame.mouse.get_pos(), (WIDTH//2, HEIGHT//2), 100)
-            p2.emit()
 
-        if pygame.mouse.get_pressed()[2]:
+        if p3.emitting:
             p3.position = (pygame.mouse.get_pos(), 0, 0)
-            p3.emit()
 
-        p.update()
+        scheduler.tick()
+        scheduler.draw()
         print(p.total_particles)
-        p2.update()
-        p3.update()
 
         previous_mouse_pos = current_mouse_pos
         pygame.display.update()
@@ -0,0 +1,58 @@
+import time
+
+
+class FixedTimestepScheduler:
+    """steps every particle system in a scene with the same fixed time step, however long frames take to draw.
+
+    real time is accumulated each tick and spent in whole steps. if the game falls far behind only max_steps steps
+    are run per tick and the rest of the time is dropped, so the simulation slows down smoothly rather than taking
+    longer and longer to catch up. the time left over in the accumulator is returned as an interpolation factor, so
+    particles can be drawn between their last two steps rather than snapping to the step grid"""
+
+    def __init__(self, step: float = 1 / 60, max_steps: int = 5, interpolate: bool = True):
+        self.step = step
+        self.max_steps = max_steps
+        self.interpolate = interpolate
+
+        self.systems = []
+        self.accumulator = 0
+        self.time = 0  # simulated seconds
+        self.dropped_time = 0  # real seconds skipped because the catch-up cap was reached
+        self.previous_time = None
+        self.alpha = 1
+
+    def add(self, system):
+        self.systems.append(system)
+
+    def remove(self, system):
+        self.systems.remove(system)
+
+    def tick(self, current_time: float = None) -> int:
+        """runs as many fixed steps as the real time since the previous tick covers, up to max_steps. returns the
+        number of steps run"""
+        if current_time is None:
+            current_time = time.perf_counter()
+        if self.previous_time is None:
+            self.previous_time = current_time
+
+        self.accumulator += current_time - self.previous_time
+        self.previous_time = current_time
+
+        steps = int(self.accumulator // self.step)
+        if steps > self.max_steps:
+            self.dropped_time += self.accumulator - self.max_steps * self.step
+            self.accumulator = self.max_steps * self.step
+            steps = self.max_steps
+
+        for _ in range(steps):
+            for system in self.systems:
+                system.step(self.step)
+            self.accumulator -= self.step
+            self.time += self.step
+
+        self.alpha = self.accumulator / self.step if self.interpolate else 1
+        return steps
+
+    def draw(self):
+        for system in self.systems:
+            system.draw(self.alpha)
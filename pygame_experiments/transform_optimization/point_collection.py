@@ -7,41 +7,241 @@
 #   each object (particle system, polygon, sprites) should add or remove themselves from the array as they are
 #   within or outside the screen
 
+# allocation:
+#   each object's points are one contiguous segment, found through the object's handle - a fixed index into the
+#   start_indices and counts tables, which are fixed up whenever a segment moves
+#   removing a segment moves the last segment into the hole if it fits (swap remove), otherwise the hole is left and
+#   the array is compacted in one pass once holes make up too much of it
+
+# culling:
+#   each handle's bounding box is kept in the bounds array, with the handles sorted by their left edge, so a query
+#   finds the objects that may be on screen with a searchsorted, accepts or rejects whole objects from their boxes, and
+#   only tests the points of objects crossing the edge of the view
+
+# transforms:
+#   each handle also has its own 2x3 affine matrix - every frame the matrices are composed with the camera, gathered
+#   onto the points through segment_ids, and all points are transformed in one einsum, with no python call per object
+
 
 import numpy as np
 
 
+IDENTITY = np.array(((1, 0, 0), (0, 1, 0)), dtype=np.float32)
+
+
 class GameObjectArray:
     """stores contiguous lists of points representing all polygons, and particle objects that are to be transformed by
     the camera and drawn to the screen"""
 
-    def __init__(self, max_points=100000):
+    COMPACT_THRESHOLD = 0.25  # fraction of the used points that may be holes before compacting
+
+    def __init__(self, max_points=100000, max_objects=None):
         self.max_points = max_points
+        self.max_objects = max_objects or max_points  # in case all objects only have 1 point
         self.points = np.zeros((max_points, 2), dtype=np.float32)
-        self.points_count = 0
-        self.start_indices = np.zeros(max_points,
-                                      dtype=np.int32)  # same length as points, in case all objects only have 1 point
-        self.objects = []
+        self.points_count = 0  # points[:points_count] holds every segment, and any holes between them
+        self.free_points = 0  # points in holes below points_count
+
+        self.segment_ids = np.full(max_points, -1, dtype=np.int32)  # handle owning each point, -1 in holes
+        self.start_indices = np.zeros(self.max_objects, dtype=np.int32)  # per handle
+        self.counts = np.zeros(self.max_objects, dtype=np.int32)  # per handle
+        self.free_handles = list(range(self.max_objects - 1, -1, -1))
+        self.objects = {}  # handle: owner
+
+        # one extra row of zeros at the end, which the -1 in holes picks out
+        self.matrices = np.zeros((self.max_objects + 1, 2, 3), dtype=np.float32)  # per handle
+        self.handle_count = 0  # every handle in use is below this
+
+        # left, top, right, bottom of each handle's points as of the last update_bounds, nan until then
+        self.bounds = np.full((self.max_objects, 4), np.nan, dtype=np.float32)
+        self.sorted_handles = np.zeros(0, dtype=np.int32)  # handles with bounds, by left edge
+        self.sorted_left = np.zeros(0, dtype=np.float32)
 
     def add_points(self, points, owner):
-        """adds points to the end of the array, and returns the index of the first point"""
-        if self.points_count + len(points) > self.max_points:
+        """adds points to the end of the array, and returns the handle of the new segment"""
+        count = len(points)
+        if self.points_count + count > self.max_points and self.free_points:
+            self.compact()
+        if self.points_count + count > self.max_points:
             raise ValueError("too many points to add")
+        if not self.free_handles:
+            raise ValueError("too many objects to add")
+
+        handle = self.free_handles.pop()
         start = self.points_count
-        self.points[start:start + len(points)] = points
-        self.points_count += len(points)
-        self.start_indices.append(start)
-        return start
+        self.points[start:start + count] = points
+        self.segment_ids[start:start + count] = handle
+        self.start_indices[handle] = start
+        self.counts[handle] = count
+        self.objects[handle] = owner
+        self.matrices[handle] = IDENTITY
+        self.bounds[handle] = np.nan
+        self.handle_count = max(self.handle_count, handle + 1)
+        self.points_count += count
+        return handle
+
+    def remove_points(self, handle):
+        """removes the segment with the given handle, filling its hole with the last segment if that fits"""
+        start, count = int(self.start_indices[handle]), int(self.counts[handle])
+        self.segment_ids[start:start + count] = -1
+        self.free_points += count
+
+        tail = int(self.segment_ids[self.points_count - 1]) if self.points_count else -1
+        if tail >= 0 and tail != handle and self.counts[tail] <= count:
+            tail_start, tail_count = int(self.start_indices[tail]), int(self.counts[tail])
+            self.points[start:start + tail_count] = self.points[tail_start:tail_start + tail_count]
+            self.segment_ids[start:start + tail_count] = tail
+            self.segment_ids[tail_start:tail_start + tail_count] = -1
+            self.start_indices[tail] = start
+            self.points_count -= tail_count
+            self.free_points -= tail_count
+            if owner_moved := getattr(self.objects[tail], "on_moved", None):
+                owner_moved(start)
+
+        self._trim()
+
+        del self.objects[handle]
+        self.counts[handle] = 0
+        self.bounds[handle] = np.nan
+        self.free_handles.append(handle)
+
+        if self.free_points > self.COMPACT_THRESHOLD * self.points_count:
+            self.compact()
+
+    def _trim(self):
+        """drops any holes at the end of the used points"""
+        if self.points_count and self.segment_ids[self.points_count - 1] < 0:
+            used = np.flatnonzero(self.segment_ids[:self.points_count] >= 0)
+            end = int(used[-1]) + 1 if len(used) else 0
+            self.free_points -= self.points_count - end
+            self.points_count = end
+
+            # empty segments own no points, so their starts can be left past the new end - keep them within it
+            empty = self._get_empty_handles()
+            self.start_indices[empty] = np.minimum(self.start_indices[empty], end)
+
+    def _get_empty_handles(self):
+        handles = self.get_live_handles()
+        return handles[self.counts[handles] == 0]
 
-    def remove_points(self, start, count):
-        """removes points from the array, starting at the given index"""
-        self.points[start:start + count] = self.points[self.points_count - count:self.points_count]
-        self.points_count -= count
+    def compact(self):
+        """closes every hole in one pass, moving segments down while keeping their order"""
+        if not self.free_points:
+            return
+        live = self.segment_ids[:self.points_count] >= 0
+        new_indices = np.cumsum(live, dtype=np.int32) - 1
+
+        # empty segments are left out of the remap, as their start can be past the last used point
+        handles = self.get_live_handles()
+        filled = handles[self.counts[handles] > 0]
+        self.start_indices[filled] = new_indices[self.start_indices[filled]]
+
+        count = int(new_indices[-1]) + 1 if len(new_indices) else 0
+        self.start_indices[handles[self.counts[handles] == 0]] = count
+        self.points[:count] = self.points[:self.points_count][live]
+        self.segment_ids[:count] = self.segment_ids[:self.points_count][live]
+        self.segment_ids[count:self.points_count] = -1
+        self.points_count = count
+        self.free_points = 0
+
+        for handle in handles.tolist():
+            if owner_moved := getattr(self.objects[handle], "on_moved", None):
+                owner_moved(int(self.start_indices[handle]))
+
+    def get_points(self, handle):
+        """returns a view of the points in the segment with the given handle"""
+        start = self.start_indices[handle]
+        return self.points[start:start + self.counts[handle]]
+
+    def set_transform(self, handle, matrix):
+        """sets the affine matrix (2x3, or 3x3 homogeneous) applied to the points of the segment with the handle"""
+        self.matrices[handle] = np.asarray(matrix)[:2]
 
     def transform(self, transform):
         """transforms all points in the array by the given transform"""
         return transform(self.points[:self.points_count])
 
+    def get_composed_matrices(self, camera=None):
+        """each handle's matrix followed by the camera matrix (2x3 or 3x3), for every handle below handle_count and
+        the row of zeros used by holes"""
+        matrices = self.matrices[:self.handle_count + 1].copy()
+        matrices[-1] = 0
+        if camera is not None:
+            camera = np.asarray(camera, dtype=np.float32)
+            np.einsum("ij,njk->nik", camera[:2, :2], self.matrices[:self.handle_count], out=matrices[:-1])
+            matrices[:-1, :, 2] += camera[:2, 2]
+        return matrices
+
+    def transform_objects(self, camera=None, out=None):
+        """transforms every point by its own segment's matrix, then by the camera matrix, in a single pass.
+        points in holes come out as (0, 0)"""
+        matrices = self.get_composed_matrices(camera)
+        segment_ids = self.segment_ids[:self.points_count]
+        per_point = matrices[segment_ids]  # -1 in holes picks the last, zero, row
+        points = self.points[:self.points_count]
+        if out is None:
+            out = np.empty_like(points)
+        out = out[:self.points_count]
+        np.einsum("nij,nj->ni", per_point[:, :, :2], points, out=out)
+        out += per_point[:, :, 2]
+        return out
+
+    def get_live_handles(self):
+        return np.fromiter(self.objects, dtype=np.int32, count=len(self.objects))
+
+    @staticmethod
+    def get_ranges(starts, counts):
+        """indices of every point in the segments with the given starts and counts, one segment after another"""
+        counts = np.asarray(counts, dtype=np.intp)
+        offsets = np.cumsum(counts) - counts
+        return np.repeat(np.asarray(starts, dtype=np.intp) - offsets, counts) + np.arange(offsets[-1] + counts[-1]
+                                                                                          if len(counts) else 0)
+
+    def update_bounds(self, points=None):
+        """recomputes every object's bounding box from points (the stored points by default, or eg the output of
+        transform_objects to cull in screen space), and re-sorts the objects by their left edge"""
+        if points is None:
+            points = self.points[:self.points_count]
+        handles = self.get_live_handles()
+        handles = handles[self.counts[handles] > 0]
+        if not len(handles):
+            self.sorted_handles = handles
+            self.sorted_left = np.zeros(0, dtype=np.float32)
+            return
+
+        # reduceat over [start, end) pairs, with a padding row so the last end is a valid index - every other result
+        # is a segment's bounds, the rest cover the holes and segments in between
+        starts = self.start_indices[handles]
+        edges = np.empty(len(handles) * 2, dtype=np.intp)
+        edges[0::2] = starts
+        edges[1::2] = starts + self.counts[handles]
+        padded = np.concatenate((points[:self.points_count], np.zeros((1, 2), dtype=points.dtype)))
+        self.bounds[handles, :2] = np.minimum.reduceat(padded, edges, axis=0)[0::2]
+        self.bounds[handles, 2:] = np.maximum.reduceat(padded, edges, axis=0)[0::2]
+
+        order = np.argsort(self.bounds[handles, 0], kind="stable")
+        self.sorted_handles = handles[order]
+        self.sorted_left = self.bounds[self.sorted_handles, 0]
+
+    def get_visible_handles(self, rect):
+        """returns the handles of the objects whose bounding boxes are inside rect, and those crossing its edge"""
+        candidates = self.sorted_handles[:np.searchsorted(self.sorted_left, rect.right, side="right")]
+        left, top, right, bottom = self.bounds[candidates].T
+        overlapping = (right >= rect.left) & (top <= rect.bottom) & (bottom >= rect.top)
+        inside = overlapping & (left >= rect.left) & (right <= rect.right) & (top >= rect.top) & (bottom <= rect.bottom)
+        return candidates[inside], candidates[overlapping & ~inside]
+
+    def get_visible_points(self, rect, points=None):
+        """returns the indices of the points within rect, using the bounds from the last update_bounds so that only
+        the points of objects crossing the edge of rect are tested one by one"""
+        if points is None:
+            points = self.points[:self.points_count]
+        inside, crossing = self.get_visible_handles(rect)
+        inside_indices = self.get_ranges(self.start_indices[inside], self.counts[inside])
+        crossing_indices = self.get_ranges(self.start_indices[crossing], self.counts[crossing])
+        crossing_indices = crossing_indices[self.get_within(points[crossing_indices], rect)]
+        return np.concatenate((inside_indices, crossing_indices))
+
     @classmethod
     def get_within(cls, points, rect):
         """returns a boolean array indicating which points are within the given rectangle"""
@@ -56,15 +256,30 @@ class GameObject:
     def __init__(self, array, size):
         self.array = array
         self.size =size
+        self.handle = None
         self.start = None
+        self.count = None
 
     def add_points(self, points):
-        """adds points to the array, and returns the index of the first point"""
-        self.start = self.array.add_points(points, self)
+        """adds points to the array, keeping the handle of the segment they are stored in"""
+        self.handle = self.array.add_points(points, self)
+        self.start = int(self.array.start_indices[self.handle])
         self.count = len(points)
 
+    def on_moved(self, start):
+        """called by the array when it moves this object's points"""
+        self.start = start
+
+    def get_points(self):
+        return self.array.get_points(self.handle)
+
+    def set_transform(self, matrix):
+        """sets the transformation applied to this object's points each frame"""
+        self.array.set_transform(self.handle, matrix)
+
     def remove_points(self):
         """removes points from the array"""
-        self.array.remove_points(self.start, self.count)
+        self.array.remove_points(self.handle)
+        self.handle = None
         self.start = None
         self.count = None
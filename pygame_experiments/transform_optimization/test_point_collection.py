@@ -0,0 +1,60 @@
+import numpy as np
+
+from point_collection import GameObject, GameObjectArray
+
+
+def test_compact_with_empty_segment():
+    array = GameObjectArray(max_points=10)
+    handles = [array.add_points(np.full((count, 2), i, dtype=np.float32), None) for i, count in enumerate((3, 2, 3, 0))]
+    array.remove_points(handles[1])
+    new = array.add_points(np.ones((4, 2)), None)
+
+    assert array.points_count == 10 and array.free_points == 0
+    assert (array.get_points(handles[0]) == 0).all() and (array.get_points(handles[2]) == 2).all()
+    assert len(array.get_points(handles[3])) == 0 and (array.get_points(new) == 1).all()
+
+
+def test_remove_with_empty_segment_past_end():
+    array = GameObjectArray(max_points=10)
+    first = array.add_points(np.zeros((3, 2)), None)
+    last = array.add_points(np.ones((2, 2)), None)
+    empty = array.add_points(np.zeros((0, 2)), None)
+    array.remove_points(last)
+    assert array.start_indices[empty] <= array.points_count == 3
+
+    array.remove_points(empty)
+    array.remove_points(first)
+    assert array.points_count == 0 and not array.objects
+
+
+def test_random_adds_and_removes():
+    # small enough that the array fills up, so adding compacts as well as removing does
+    array = GameObjectArray(max_points=60, max_objects=20)
+    rng = np.random.default_rng(0)
+    expected = {}  # owner: its points
+    next_id = 0
+
+    for _ in range(2000):
+        if expected and (rng.random() < 0.45 or len(expected) == 20):
+            owner = list(expected)[rng.integers(len(expected))]
+            owner.remove_points()
+            del expected[owner]
+        else:
+            count = int(rng.integers(0, 8))
+            if array.points_count - array.free_points + count > array.max_points:
+                continue
+            points = np.column_stack((np.full(count, next_id), np.arange(count))).astype(np.float32)
+            next_id += 1
+            owner = GameObject(array, count)
+            owner.add_points(points)
+            expected[owner] = points
+
+        for owner, points in expected.items():
+            assert (array.get_points(owner.handle) == points).all()
+            if owner.count:
+                start = int(array.start_indices[owner.handle])
+                assert owner.start == start
+                assert (array.segment_ids[start:start + owner.count] == owner.handle).all()
+        assert sorted(array.objects) == sorted(owner.handle for owner in expected)
+        assert array.free_points == (array.segment_ids[:array.points_count] < 0).sum()
+        assert array.points_count - array.free_points == sum(owner.count for owner in expected)
@@ -0,0 +1,204 @@
+# times the ways of rotating and translating an array of points against each other, over a sweep of array sizes and
+# of chunk sizes (transforming the array as many smaller sub arrays, as separate game objects would), after checking
+# that every variant gives the same points.
+# run from this directory with `python transform_benchmark.py`, writing the results with --output results.csv (or
+# .json), and plotting them with --plot, which needs matplotlib.
+# the peak memory each variant allocates to transform the whole array is measured alongside its time
+
+import argparse
+import csv
+import json
+import time
+import tracemalloc
+
+import numpy
+
+from transform_pipeline import TransformPipeline
+
+
+TRANSLATION = numpy.array([10, -5])
+ROTATION = 55
+
+
+def get_matrix(rotation=ROTATION, translation=TRANSLATION):
+    """3x3 homogeneous matrix rotating points by rotation radians then translating them"""
+    c, s = numpy.cos(rotation), numpy.sin(rotation)
+    return numpy.array([[c, -s, translation[0]],
+                        [s, c, translation[1]],
+                        [0, 0, 1]])
+
+
+def transform_naive(points, matrix):
+    """transforms the points in place, one column at a time"""
+    x = points[:, 0].copy()
+    points[:, 0] = matrix[0, 0] * x + matrix[0, 1] * points[:, 1] + matrix[0, 2]
+    points[:, 1] = matrix[1, 0] * x + matrix[1, 1] * points[:, 1] + matrix[1, 2]
+    return points
+
+
+def make_homogeneous(points):
+    return numpy.hstack((points, numpy.ones((points.shape[0], 1))))
+
+
+def transform_homogeneous(points, matrix):
+    """pads the points with a column of ones and multiplies by the whole matrix"""
+    return (make_homogeneous(points) @ matrix.T)[:, :2]
+
+
+def transform_einsum(points, matrix):
+    return numpy.einsum("ij,nj->ni", matrix[:2, :2], points) + matrix[:2, 2]
+
+
+def transform_out(points, matrix, out):
+    """multiplies by the linear part and adds the translation, both into a preallocated output"""
+    numpy.matmul(points, matrix[:2, :2].T, out=out)
+    out += matrix[:2, 2]
+    return out
+
+
+def transform_pipeline(points, matrix, out):
+    """the float32 TransformPipeline, given the matrix each call like the other variants (setting it is only two small
+    copies)"""
+    _pipeline.set_matrix(matrix)
+    return _pipeline(points, out)
+
+
+# name: function(points, matrix, out), where out is an array the size of points each variant may write into
+VARIANTS = {
+    "naive": lambda points, matrix, out: transform_naive(points, matrix),
+    "homogeneous": lambda points, matrix, out: transform_homogeneous(points, matrix),
+    "einsum": lambda points, matrix, out: transform_einsum(points, matrix),
+    "out": transform_out,
+    "pipeline": transform_pipeline,
+}
+
+# variants working on something other than float64 points, and how far they may differ from einsum in check_agreement
+DTYPES = {"pipeline": numpy.float32}
+TOLERANCES = {"pipeline": 1e-3}
+
+_pipeline = TransformPipeline(0)
+
+
+def split(array, chunk_size):
+    """views of consecutive chunk_size rows of array (the last may be shorter)"""
+    return [array[i:i + chunk_size] for i in range(0, len(array), chunk_size)]
+
+
+def check_agreement(variants=VARIANTS, size=1000, seed=0, tolerance=1e-9, matrix=None):
+    """runs every variant on the same points, raising an AssertionError if any differs from einsum by more than the
+    tolerance. returns the largest difference of each variant"""
+    points = numpy.random.default_rng(seed).random((size, 2)) * 1000
+    matrix = get_matrix() if matrix is None else matrix
+    expected = transform_einsum(points, matrix)
+
+    differences = {}
+    for name, function in variants.items():
+        variant_points = points.astype(DTYPES.get(name, points.dtype))
+        result = function(variant_points, matrix, numpy.empty_like(variant_points))
+        differences[name] = float(numpy.abs(result - expected).max())
+        assert differences[name] <= TOLERANCES.get(name, tolerance), f"{name} differs from einsum by {differences[name]}"
+    return differences
+
+
+def time_variant(function, points, matrix, chunk_size=None, repeats=20):
+    """average seconds taken to transform all the points, as one array or as chunks of chunk_size points"""
+    chunks = split(points, chunk_size) if chunk_size else [points]
+    outs = [numpy.empty_like(chunk) for chunk in chunks]
+
+    start = time.perf_counter()
+    for _ in range(repeats):
+        for chunk, out in zip(chunks, outs):
+            function(chunk, matrix, out)
+    return (time.perf_counter() - start) / repeats
+
+
+def measure_memory(function, points, matrix):
+    """peak bytes allocated by one call transforming all the points, not counting the output passed to it"""
+    out = numpy.empty_like(points)
+    function(points, matrix, out)  # warm up anything allocated once
+    tracemalloc.start()
+    function(points, matrix, out)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return peak
+
+
+def run(sizes, chunk_sizes, variants=VARIANTS, repeats=20, seed=0):
+    """times every variant at every array size and chunk size (None meaning the whole array at once), returning a row
+    of results for each"""
+    rng = numpy.random.default_rng(seed)
+    matrix = get_matrix()
+    results = []
+    for size in sizes:
+        points = rng.random((size, 2)) * 1000
+        peaks = {name: measure_memory(function, points.astype(DTYPES.get(name, points.dtype)), matrix)
+                 for name, function in variants.items()}
+        for chunk_size in chunk_sizes:
+            for name, function in variants.items():
+                seconds = time_variant(function, points.astype(DTYPES.get(name, points.dtype)), matrix, chunk_size,
+                                       repeats)
+                results.append({"variant": name, "size": size, "chunk_size": chunk_size or size,
+                                "seconds": seconds, "per_point_ns": seconds / size * 1e9, "peak_bytes": peaks[name]})
+                print(f"{name:<12}size: {size:<10}chunk size: {chunk_size or size:<10}"
+                      f"time: {round(seconds * 1000, 4)} ms\t\tper point: {round(seconds / size * 1e9, 2)} ns\t\t"
+                      f"peak allocated: {round(peaks[name] / 1024, 1)} KiB")
+    return results
+
+
+def write(results, path):
+    """writes the results as csv, or as json if the path ends in .json"""
+    with open(path, "w", newline="") as file:
+        if path.endswith(".json"):
+            json.dump(results, file, indent=4)
+        else:
+            writer = csv.DictWriter(file, fieldnames=list(results[0]))
+            writer.writeheader()
+            writer.writerows(results)
+
+
+def plot(results):
+    """per point time against array size, a line for each variant and chunk size"""
+    import matplotlib.pyplot as plt
+
+    fig, ax = plt.subplots()
+    lines = {}
+    for result in results:
+        chunked = result["chunk_size"] != result["size"]
+        label = f"{result['variant']} ({'chunks of ' + str(result['chunk_size']) if chunked else 'whole array'})"
+        lines.setdefault(label, []).append((result["size"], result["per_point_ns"]))
+    for label, line in lines.items():
+        ax.plot(*zip(*line), label=label, marker=".")
+    ax.set_xscale("log")
+    ax.set_xlabel("points")
+    ax.set_ylabel("time per point (ns)")
+    ax.legend()
+    plt.show()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 100000, 1000000])
+    parser.add_argument("--chunk-sizes", type=int, nargs="+", default=[0, 100, 1000],
+                        help="0 transforms the whole array at once")
+    parser.add_argument("--variants", nargs="+", choices=list(VARIANTS), default=list(VARIANTS))
+    parser.add_argument("--repeats", type=int, default=20)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="file to write the results to, as csv or .json")
+    parser.add_argument("--plot", action="store_true")
+    args = parser.parse_args()
+
+    variants = {name: VARIANTS[name] for name in args.variants}
+    print("largest difference from einsum:", check_agreement(variants, seed=args.seed))
+    # and with another matrix, so a variant stuck on the default one is caught
+    check_agreement(variants, seed=args.seed, matrix=get_matrix(-1.2, (-300, 40)))
+
+    results = run(args.sizes, [chunk_size or None for chunk_size in args.chunk_sizes], variants, args.repeats,
+                  args.seed)
+    if args.output:
+        write(results, args.output)
+    if args.plot:
+        plot(results)
+
+
+if __name__ == "__main__":
+    main()
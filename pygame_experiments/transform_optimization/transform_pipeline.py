@@ -0,0 +1,40 @@
+import numpy as np
+
+
+class TransformPipeline:
+    """applies an affine transform to float32 (n, 2) point arrays without padding them to homogeneous coordinates or
+    allocating anything per frame - the linear part is a 2x2 matmul written straight into a preallocated output, and the
+    translation is added to it in place.
+
+    a pipeline is callable, so it can be passed straight to GameObjectArray.transform"""
+
+    def __init__(self, capacity=100000):
+        self.capacity = capacity
+        self.out = np.zeros((capacity, 2), dtype=np.float32)
+        self.linear = np.eye(2, dtype=np.float32)  # transposed, as the points are rows
+        self.translation = np.zeros(2, dtype=np.float32)
+
+    def set_matrix(self, matrix):
+        """sets the transform from a 3x3 homogeneous (or 2x3) matrix, as used for column vectors"""
+        matrix = np.asarray(matrix)
+        self.linear[:] = matrix[:2, :2].T
+        self.translation[:] = matrix[:2, 2]
+
+    def apply(self, points, out=None):
+        """returns the transformed points, written into out, or into the pipeline's own buffer if out is None - in
+        which case the result is only valid until the next call"""
+        if out is None:
+            if len(points) > self.capacity:
+                raise ValueError("too many points for the pipeline's buffer")
+            out = self.out[:len(points)]
+        np.matmul(points, self.linear, out=out)
+        np.add(out, self.translation, out=out)
+        return out
+
+    def apply_ip(self, points):
+        """transforms the points in place, through the pipeline's buffer"""
+        points[:] = self.apply(points)
+        return points
+
+    def __call__(self, points, out=None):
+        return self.apply(points, out)
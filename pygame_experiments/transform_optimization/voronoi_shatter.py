@@ -1,3 +1,209 @@
+# shatters a polygon into voronoi fragments, each registered as its own object in a GameObjectArray, so that every
+# shard moves and spins through the array's per object transforms in a single pass.
+# cutting up the unit square is the slow part, so each fracture pattern is made once per seed and cached - shattering
+# an object only scales the cached cells to its bounding box and clips the shape against each of them, which is quick
+# enough to do in the middle of a frame
+
+from functools import lru_cache
+from math import ceil, sqrt
+
+import numpy as np
+
+from point_collection import GameObject, GameObjectArray
+
+
+UNIT_SQUARE = ((0, 0), (1, 0), (1, 1), (0, 1))
+PATTERN_CACHE_SIZE = 64
+
+
+def clip_polygon(polygon, normal, limit):
+    """sutherland-hodgman clip of polygon to the half plane where dot(normal, point) <= limit"""
+    nx, ny = normal
+    clipped = []
+    if not polygon:
+        return clipped
+    previous = polygon[-1]
+    previous_distance = nx * previous[0] + ny * previous[1] - limit
+    for point in polygon:
+        distance = nx * point[0] + ny * point[1] - limit
+        if (distance <= 0) != (previous_distance <= 0):
+            t = previous_distance / (previous_distance - distance)
+            clipped.append((previous[0] + (point[0] - previous[0]) * t, previous[1] + (point[1] - previous[1]) * t))
+        if distance <= 0:
+            clipped.append(point)
+        previous, previous_distance = point, distance
+    return clipped
+
+
+def clip_to_convex(polygon, convex):
+    """the part of polygon inside the convex (anticlockwise, in y up terms) polygon, clipping against each edge"""
+    for (ax, ay), (bx, by) in zip(convex, convex[1:] + convex[:1]):
+        # the outward normal of an anticlockwise edge
+        polygon = clip_polygon(polygon, (by - ay, ax - bx), (by - ay) * ax + (ax - bx) * ay)
+        if not polygon:
+            break
+    return polygon
+
+
+def get_area(polygon):
+    """signed area, positive if the polygon winds anticlockwise (in y up terms)"""
+    return sum(ax * by - bx * ay for (ax, ay), (bx, by) in zip(polygon, polygon[1:] + polygon[:1])) / 2
+
+
+def get_centroid(polygon):
+    area = get_area(polygon)
+    cx = cy = 0
+    for (ax, ay), (bx, by) in zip(polygon, polygon[1:] + polygon[:1]):
+        cross = ax * by - bx * ay
+        cx += (ax + bx) * cross
+        cy += (ay + by) * cross
+    return cx / (6 * area), cy / (6 * area)
+
+
 class VoronoiSeed:
-    def __init__(self, n_points, variance, offset_y, offset_x ):
-        self.layers
\ No newline at end of file
+    """a fracture pattern - voronoi cells covering the unit square, around seed points jittered from an even grid.
+
+    variance is how far (as a fraction of a grid cell) each point may stray from the centre of its cell, and the
+    offsets slide the whole pattern across the square, wrapping at its edges. patterns with a seed are cached by their
+    parameters (keeping the PATTERN_CACHE_SIZE most recently used), so making the same seed again is free - without a
+    seed every pattern is new, so is never cached"""
+
+    def __init__(self, n_points, variance, offset_y, offset_x, seed=None):
+        self.key = (n_points, variance, offset_y, offset_x, seed)
+        if seed is None:
+            self.points, self.cells = self.generate(*self.key)
+        else:
+            self.points, self.cells = get_cached_pattern(*self.key)
+
+    @staticmethod
+    def generate(n_points, variance, offset_y, offset_x, seed=None):
+        """returns the seed points, and the cell around each, as a list of anticlockwise vertices"""
+        rng = np.random.default_rng(seed)
+        side = ceil(sqrt(n_points))
+        grid = np.stack(np.divmod(np.arange(side * side), side), axis=1)[:, ::-1]
+        chosen = np.sort(rng.choice(side * side, n_points, replace=False))
+        points = (grid[chosen] + 0.5 + (rng.random((n_points, 2)) - 0.5) * variance) / side
+        points = (points + (offset_x, offset_y)) % 1
+
+        # each cell is the square clipped to the half plane nearer its point than each other point. only points close
+        # enough to have a shared edge can cut a cell, so they are tried nearest first, stopping once the next point
+        # is more than twice as far away as any vertex of the cell
+        cells = []
+        for i, point in enumerate(points):
+            offsets = points - point
+            distances = np.hypot(offsets[:, 0], offsets[:, 1])
+            cell = list(UNIT_SQUARE)
+            for j in np.argsort(distances)[1:].tolist():
+                radius = max(sqrt((x - point[0]) ** 2 + (y - point[1]) ** 2) for x, y in cell)
+                if distances[j] > 2 * radius:
+                    break
+                midpoint = (point + points[j]) / 2
+                cell = clip_polygon(cell, offsets[j], float(offsets[j] @ midpoint))
+            cells.append(cell)
+        return points, cells
+
+    def get_cells(self, rect):
+        """the cells scaled to cover a (left, top, width, height) rectangle"""
+        left, top, width, height = rect
+        return [[(left + x * width, top + y * height) for x, y in cell] for cell in self.cells]
+
+
+@lru_cache(maxsize=PATTERN_CACHE_SIZE)
+def get_cached_pattern(n_points, variance, offset_y, offset_x, seed):
+    return VoronoiSeed.generate(n_points, variance, offset_y, offset_x, seed)
+
+
+class Shattered:
+    """the fragments of a shattered polygon, each an object in a GameObjectArray with its points relative to its own
+    centroid. every fragment's position, velocity, angle and spin are kept in arrays, and update turns them all into
+    the array's per object matrices at once"""
+
+    def __init__(self, array: GameObjectArray, polygon, pattern: VoronoiSeed, speed=200, spin=3, rng=None):
+        self.array = array
+        rng = rng if rng is not None else np.random.default_rng()
+
+        polygon = [tuple(point) for point in polygon]
+        if get_area(polygon) < 0:
+            polygon.reverse()
+        xs, ys = zip(*polygon)
+        rect = (min(xs), min(ys), max(xs) - min(xs), max(ys) - min(ys))
+        centre = get_centroid(polygon)
+
+        self.fragments = []
+        centroids = []
+        for cell in pattern.get_cells(rect):
+            fragment = clip_to_convex(polygon, cell)
+            if len(fragment) < 3 or get_area(fragment) <= 1e-9:
+                continue
+            centroid = get_centroid(fragment)
+            game_object = GameObject(array, len(fragment))
+            game_object.add_points(np.array(fragment) - centroid)
+            self.fragments.append(game_object)
+            centroids.append(centroid)
+
+        n = len(self.fragments)
+        self.handles = np.array([fragment.handle for fragment in self.fragments], dtype=np.intp)
+        self.positions = np.array(centroids, dtype=np.float32).reshape(-1, 2)
+        outward = self.positions - centre
+        outward /= np.maximum(np.hypot(outward[:, 0], outward[:, 1]), 1e-9)[:, np.newaxis]
+        self.velocities = outward * speed * rng.uniform(0.5, 1.5, (n, 1)).astype(np.float32)
+        self.angles = np.zeros(n, dtype=np.float32)
+        self.spins = rng.uniform(-spin, spin, n).astype(np.float32)
+        self.update(0)
+
+    def update(self, dt, gravity=(0, 0)):
+        """moves and spins every fragment by dt seconds, and writes their matrices into the array"""
+        self.velocities += np.asarray(gravity, dtype=np.float32) * dt
+        self.positions += self.velocities * dt
+        self.angles += self.spins * dt
+
+        c, s = np.cos(self.angles), np.sin(self.angles)
+        matrices = self.array.matrices[self.handles]
+        matrices[:, 0, 0] = c
+        matrices[:, 0, 1] = -s
+        matrices[:, 1, 0] = s
+        matrices[:, 1, 1] = c
+        matrices[:, :, 2] = self.positions
+        self.array.matrices[self.handles] = matrices
+
+    def remove(self):
+        for fragment in self.fragments:
+            fragment.remove_points()
+        self.fragments = []
+        self.handles = self.handles[:0]
+
+
+if __name__ == "__main__":
+    import pygame
+
+    pygame.init()
+    screen = pygame.display.set_mode((1000, 800))
+    clock = pygame.time.Clock()
+    array = GameObjectArray(100000, 10000)
+    shape = [(300, 250), (700, 220), (760, 480), (520, 620), (260, 520), (420, 420)]
+    pieces = []
+    seed = 0
+
+    running = True
+    while running:
+        dt = clock.tick(60) / 1000
+        for event in pygame.event.get():
+            if event.type == pygame.QUIT:
+                running = False
+            elif event.type == pygame.MOUSEBUTTONDOWN:
+                seed += 1
+                pieces.append(Shattered(array, shape, VoronoiSeed(24, 0.8, 0, 0, seed % 4)))
+
+        screen.fill((0, 0, 0))
+        for piece in pieces:
+            piece.update(dt, gravity=(0, 400))
+        points = array.transform_objects()
+        pygame.draw.polygon(screen, (80, 80, 80), shape, 1)
+        for piece in pieces:
+            for fragment in piece.fragments:
+                pygame.draw.polygon(screen, (200, 200, 255), points[fragment.start:fragment.start + fragment.count], 1)
+        for piece in pieces[:]:
+            if not len(piece.positions) or piece.positions[:, 1].min() > 1200:
+                piece.remove()
+                pieces.remove(piece)
+        pygame.display.flip()
@@ -0,0 +1,109 @@
+import numpy
+
+from utilities.vector import VectorSpace, compose_matrices, invert_matrix, IDENTITY
+
+
+class SceneNode:
+    """a node in a transform hierarchy - each node owns a VectorSpace placing it relative to its parent, and can have
+    points attached to it in its own local coordinates.
+
+    a node's world matrix (its parent's world matrix followed by its own space) is cached, and only recomposed when it
+    is looked up after the node's space, or the space of any node above it, has changed. changing a space marks its
+    node and every node below it dirty, without recomposing anything until it is needed"""
+
+    def __init__(self, space: VectorSpace = None, parent=None, points=None):
+        self.space = space if space is not None else VectorSpace()
+        self.space.dependents.add(self)
+        self.parent = None
+        self.children = []
+
+        self.points = numpy.zeros((0, 2)) if points is None else numpy.asarray(points, dtype=float).reshape(-1, 2)
+
+        self._world = None
+        self._world_inverse = None
+        if parent is not None:
+            parent.add_child(self)
+
+    def add_child(self, node):
+        if node.parent is not None:
+            node.parent.remove_child(node)
+        node.parent = self
+        self.children.append(node)
+        node.invalidate()
+        return node
+
+    def remove_child(self, node):
+        self.children.remove(node)
+        node.parent = None
+        node.invalidate()
+
+    def attach_points(self, points):
+        """attaches points (in this node's local coordinates) to the node, after any already attached"""
+        self.points = numpy.concatenate((self.points, numpy.asarray(points, dtype=float).reshape(-1, 2)))
+
+    def invalidate(self, space: VectorSpace = None):
+        """marks this node's world matrix, and those of every node below it, as out of date. nodes already marked
+        dirty have dirty descendants too, so the walk stops at them"""
+        stack = [self]
+        while stack:
+            node = stack.pop()
+            if node._world is None and node is not self:
+                continue
+            node._world = None
+            node._world_inverse = None
+            stack.extend(node.children)
+
+    def get_world_matrix(self):
+        """matrix taking points in this node's local coordinates to world coordinates"""
+        if self._world is None:
+            # walk up to the nearest clean ancestor, then compose back down
+            dirty = []
+            node = self
+            while node is not None and node._world is None:
+                dirty.append(node)
+                node = node.parent
+            matrix = IDENTITY if node is None else node._world
+            for node in reversed(dirty):
+                matrix = compose_matrices(matrix, node.space.get_matrix())
+                node._world = matrix
+        return self._world
+
+    def get_world_inverse_matrix(self):
+        if self._world_inverse is None:
+            self._world_inverse = invert_matrix(self.get_world_matrix())
+        return self._world_inverse
+
+    def to_world(self, points) -> numpy.ndarray:
+        matrix = numpy.array(self.get_world_matrix())
+        return numpy.asarray(points, dtype=float).reshape(-1, 2) @ matrix[:2, :2].T + matrix[:2, 2]
+
+    def to_local(self, points) -> numpy.ndarray:
+        matrix = numpy.array(self.get_world_inverse_matrix())
+        return numpy.asarray(points, dtype=float).reshape(-1, 2) @ matrix[:2, :2].T + matrix[:2, 2]
+
+    def walk(self):
+        """yields this node and every node below it, parents before children"""
+        stack = [self]
+        while stack:
+            node = stack.pop()
+            yield node
+            stack.extend(reversed(node.children))
+
+    def transform_subtree(self, camera=None) -> numpy.ndarray:
+        """world positions of the points attached to every node in this subtree, in walk order, optionally followed by
+        a camera matrix (eg a node's world inverse matrix). each node's matrix is repeated over its points, and all
+        the points are transformed together with a single einsum"""
+        nodes = [node for node in self.walk() if len(node.points)]
+        if not nodes:
+            return numpy.zeros((0, 2))
+
+        matrices = numpy.array([node.get_world_matrix() for node in nodes])[:, :2]
+        if camera is not None:
+            camera = numpy.asarray(camera)
+            matrices = numpy.einsum("ij,njk->nik", camera[:2, :2], matrices)
+            matrices[:, :, 2] += camera[:2, 2]
+
+        counts = [len(node.points) for node in nodes]
+        points = numpy.concatenate([node.points for node in nodes])
+        per_point = numpy.repeat(matrices, counts, axis=0)
+        return numpy.einsum("nij,nj->ni", per_point[:, :, :2], points) + per_point[:, :, 2]
@@ -0,0 +1,28 @@
+from utilities.vector import Vector, VectorSpace, VectorSpaceChain
+
+
+def test_spaces_sharing_a_position_vector():
+    position = Vector((0, 0))
+    a, b = VectorSpace(), VectorSpace()
+    a.position = position
+    b.position = position
+    chain = VectorSpaceChain([b])
+    b.get_matrix()
+
+    a.translate((5, 0))
+
+    assert (position.x, position.y) == (0, 0)
+    assert (b.position.x, b.position.y) == (0, 0)
+    assert b.get_matrix()[0][2] == 0 and chain.get_matrix()[0][2] == 0
+    assert a.get_matrix()[0][2] == 5
+
+
+def test_translate_invalidates_dependents():
+    space = VectorSpace((1, 2))
+    chain = VectorSpaceChain([space, VectorSpace((10, 0))])
+    chain.get_matrix()
+
+    space.translate((3, 4))
+
+    point = Vector((0, 0)).transform(chain)
+    assert (point.x, point.y) == (14, 6)
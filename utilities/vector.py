@@ -1,29 +1,56 @@
 from math import sin, cos, sqrt, pi
+from weakref import WeakSet
+
+IDENTITY = ((1, 0, 0), (0, 1, 0), (0, 0, 1))
+
+
+def compose_matrices(a, b):
+    """returns the 3x3 homogeneous matrix a @ b - the transformation b followed by a"""
+    (a00, a01, a02), (a10, a11, a12), _ = a
+    (b00, b01, b02), (b10, b11, b12), _ = b
+    return ((a00 * b00 + a01 * b10, a00 * b01 + a01 * b11, a00 * b02 + a01 * b12 + a02),
+            (a10 * b00 + a11 * b10, a10 * b01 + a11 * b11, a10 * b02 + a11 * b12 + a12),
+            (0, 0, 1))
+
+
+def invert_matrix(matrix):
+    """inverse of a 3x3 homogeneous 2D affine matrix"""
+    (a, b, tx), (c, d, ty), _ = matrix
+    determinant = a * d - b * c
+    a, b, c, d = d / determinant, -b / determinant, -c / determinant, a / determinant
+    return ((a, b, -(a * tx + b * ty)),
+            (c, d, -(c * tx + d * ty)),
+            (0, 0, 1))
 
 
 class Vector:
-    """2D vector with arithmetic functionality"""
+    """2D vector with arithmetic functionality
+
+    slotted, so instances are small and attribute access skips the instance dict. the in-place operators (+=, -=, *=,
+    /=) modify the vector rather than creating a new one, so loops that accumulate into a vector don't allocate - but
+    unlike a + b, a += b is seen by everything else holding the same vector. copy() a vector before accumulating into
+    it if it may be shared"""
+    __slots__ = ("x", "y")
 
     def __init__(self, values=(0, 0)):
-        if hasattr(values, '__iter__') and len(values) == 2:  # Maybe also type check to prevent strings eg "aa"
-            self.x, self.y = values
+        self.x, self.y = values
 
     def __xor__(self, other):
         # Wedge product
         if isinstance(other, Vector):
-            return self.x * other.get_y() - self.y * other.get_x()
+            return self.x * other.y - self.y * other.x
 
     def __add__(self, other):
-        if isinstance(other, (int, float)):
+        if isinstance(other, Vector):
+            return Vector((self.x + other.x, self.y + other.y))
+        elif isinstance(other, (int, float)):
             return Vector((self.x + other, self.y + other))
-        elif isinstance(other, Vector):
-            return Vector((self.x + other.get_x(), self.y + other.get_y()))
 
     def __sub__(self, other):
-        if isinstance(other, (int, float)):
+        if isinstance(other, Vector):
+            return Vector((self.x - other.x, self.y - other.y))
+        elif isinstance(other, (int, float)):
             return Vector((self.x - other, self.y - other))
-        elif isinstance(other, Vector):
-            return Vector((self.x - other.get_x(), self.y - other.get_y()))
 
     def __mul__(self, other):
         if isinstance(other, (int, float)):
@@ -35,6 +62,43 @@ class Vector:
         if isinstance(other, (int, float)):
             return Vector((self.x / other, self.y / other))
 
+    def __iadd__(self, other):
+        if isinstance(other, Vector):
+            self.x += other.x
+            self.y += other.y
+        elif isinstance(other, (int, float)):
+            self.x += other
+            self.y += other
+        else:
+            return NotImplemented
+        return self
+
+    def __isub__(self, other):
+        if isinstance(other, Vector):
+            self.x -= other.x
+            self.y -= other.y
+        elif isinstance(other, (int, float)):
+            self.x -= other
+            self.y -= other
+        else:
+            return NotImplemented
+        return self
+
+    def __imul__(self, other):
+        # only scaling can be done in place, the dot product of two vectors is a scalar
+        if isinstance(other, (int, float)):
+            self.x *= other
+            self.y *= other
+            return self
+        return NotImplemented
+
+    def __itruediv__(self, other):
+        if isinstance(other, (int, float)):
+            self.x /= other
+            self.y /= other
+            return self
+        return NotImplemented
+
     def __pow__(self, other):
         if other == 2:
             return Vector((self.x ** 2, self.y ** 2))
@@ -78,17 +142,25 @@ class Vector:
 
     def rotate(self, theta):
         # theta *= pi / 180
-        x = self.x * cos(theta) - self.y * sin(theta)
-        y = self.x * sin(theta) + self.y * cos(theta)
-        return Vector((x, y))
+        c, s = cos(theta), sin(theta)
+        return Vector((self.x * c - self.y * s, self.x * s + self.y * c))
 
     def rotate_ip(self, theta):
         # theta *= pi / 180
-        tmp = self.x * cos(theta) - self.y * sin(theta)
-        self.y = self.x * sin(theta) + self.y * cos(theta)
-        self.x = tmp
+        c, s = cos(theta), sin(theta)
+        self.x, self.y = self.x * c - self.y * s, self.x * s + self.y * c
+
+    def apply_matrix(self, matrix):
+        """returns this point transformed by a 3x3 homogeneous matrix"""
+        (a, b, tx), (c, d, ty), _ = matrix
+        return Vector((a * self.x + b * self.y + tx, c * self.x + d * self.y + ty))
 
     def transform(self, spaces):
+        """applies each space's rotation then translation in turn. a VectorSpaceChain (or a single VectorSpace) is
+        applied with its cached matrix instead"""
+        if isinstance(spaces, (VectorSpace, VectorSpaceChain)):
+            return self.apply_matrix(spaces.get_matrix())
+
         new = Vector((self.x, self.y))
         for space in spaces:
             if isinstance(space, VectorSpace):
@@ -97,6 +169,9 @@ class Vector:
         return new
 
     def transform_inverse(self, spaces):
+        if isinstance(spaces, (VectorSpace, VectorSpaceChain)):
+            return self.apply_matrix(spaces.get_inverse_matrix())
+
         new = Vector((self.x, self.y))
         for space in spaces[::-1]:
             if isinstance(space, VectorSpace):
@@ -107,11 +182,10 @@ class Vector:
     def normalise(self):
         if self.x == self.y == 0:
             return Vector((1, 0))
-        new = Vector((self.x, self.y))
-        return new / abs(new)
+        return self / self.mag()
 
     def mag(self):
-        return sqrt(self.x ** 2 + self.y ** 2)
+        return sqrt(self.x * self.x + self.y * self.y)
 
     def hat(self):
         return self / self.mag()
@@ -130,20 +204,121 @@ class Vector:
 
 
 class VectorSpace:
+    """a rotation followed by a translation. its homogeneous matrix and the matrix's inverse are cached, and only
+    recalculated after the space is rotated or translated (or its position or direction is reassigned) - anything
+    whose cached matrix includes this space (eg a VectorSpaceChain) registers as a dependent to be invalidated too.
+    changing the position vector's components directly bypasses this, call invalidate() after doing so"""
+
     def __init__(self, position=None, direction=None):
         if position is None:
             position = (0, 0)
         if direction is None:
             direction = 0
 
-        self.position = Vector(position)
+        self._matrix = None
+        self._inverse = None
+        self.dependents = WeakSet()
+
+        self.position = position
         self.direction = direction
 
+    @property
+    def position(self):
+        return self._position
+
+    @position.setter
+    def position(self, position):
+        # copied, as a vector shared with anything else could be changed in place (eg by +=) behind the cache's back
+        self._position = Vector(position)
+        self.invalidate()
+
+    @property
+    def direction(self):
+        return self._direction
+
+    @direction.setter
+    def direction(self, direction):
+        self._direction = direction
+        self.invalidate()
+
+    def invalidate(self):
+        self._matrix = None
+        self._inverse = None
+        for dependent in list(self.dependents):
+            dependent.invalidate(self)
+
+    def get_matrix(self):
+        if self._matrix is None:
+            c, s = cos(self._direction), sin(self._direction)
+            self._matrix = ((c, -s, self._position.x),
+                            (s, c, self._position.y),
+                            (0, 0, 1))
+        return self._matrix
+
+    def get_inverse_matrix(self):
+        if self._inverse is None:
+            c, s = cos(self._direction), sin(self._direction)
+            x, y = self._position.x, self._position.y
+            self._inverse = ((c, s, -(c * x + s * y)),
+                             (-s, c, s * x - c * y),
+                             (0, 0, 1))
+        return self._inverse
+
     def rotate(self, theta):
         self.direction += theta
 
     def translate(self, position):
-        self.position += Vector(position)
+        self.position = self.position + Vector(position)
 
     def __neg__(self):
         return VectorSpace(-self.position, -self.direction)
+
+
+class VectorSpaceChain:
+    """a sequence of vector spaces applied in order, as in Vector.transform, collapsed into one cached matrix.
+
+    the matrix of every prefix of the chain is cached. each space is applied after the previous one, so later spaces are
+    outer transforms (the opposite of a SceneNode's children). changing a space invalidates the cached products from it
+    onward, and the next lookup recomposes from that space on, reusing the cached prefix before it"""
+
+    def __init__(self, spaces=()):
+        self.spaces = [space for space in spaces if isinstance(space, VectorSpace)]
+        self.prefixes = [IDENTITY]  # prefixes[i] is the matrix of the first i spaces
+        self.dirty_from = 0  # index of the first space whose prefix matrix is out of date
+        self._inverse = None
+        for space in self.spaces:
+            space.dependents.add(self)
+
+    def __len__(self):
+        return len(self.spaces)
+
+    def __iter__(self):
+        return iter(self.spaces)
+
+    def append(self, space: VectorSpace):
+        self.spaces.append(space)
+        space.dependents.add(self)
+        self.invalidate(space)
+
+    def invalidate(self, space: VectorSpace):
+        for i, other in enumerate(self.spaces[:self.dirty_from]):
+            if other is space:
+                self.dirty_from = i
+                break
+        self._inverse = None
+
+    def get_matrix(self, depth: int = None):
+        """matrix of the first `depth` spaces of the chain, or of the whole chain"""
+        if depth is None:
+            depth = len(self.spaces)
+        if self.dirty_from < depth:
+            del self.prefixes[self.dirty_from + 1:]
+            for space in self.spaces[self.dirty_from:depth]:
+                self.prefixes.append(compose_matrices(space.get_matrix(), self.prefixes[-1]))
+            self.dirty_from = depth
+        return self.prefixes[depth]
+
+    def get_inverse_matrix(self):
+        if self._inverse is None:
+            self._inverse = invert_matrix(self.get_matrix())
+        return self._inverse
@@ -0,0 +1,170 @@
+from math import sin, cos
+
+import numpy
+
+from utilities.vector import Vector, VectorSpace, VectorSpaceChain, IDENTITY, compose_matrices
+
+
+class VectorArray:
+    """many 2D vectors stored as rows of an (n, 2) float array, with the same operations as Vector applied to every
+    row by a single numpy call. other operands can be a VectorArray of the same length, a single Vector or pair (applied
+    to every row), or a scalar"""
+    __slots__ = ("array",)
+
+    def __init__(self, values=(), copy: bool = True):
+        """values can be anything numpy can make an (n, 2) array from - a list of Vectors or pairs, or an array"""
+        array = numpy.array(values, dtype=float, copy=copy or None).reshape(-1, 2)
+        self.array = array
+
+    @classmethod
+    def zeros(cls, n: int):
+        return cls(numpy.zeros((n, 2)), copy=False)
+
+    @staticmethod
+    def _operand(other):
+        """returns other as something numpy can broadcast against the rows"""
+        if isinstance(other, VectorArray):
+            return other.array
+        if isinstance(other, Vector):
+            return numpy.array((other.x, other.y))
+        return other
+
+    def __len__(self):
+        return len(self.array)
+
+    def __iter__(self):
+        for x, y in self.array.tolist():
+            yield Vector((x, y))
+
+    def __getitem__(self, item):
+        if isinstance(item, (int, numpy.integer)):
+            return Vector(self.array[item].tolist())
+        return VectorArray(self.array[item], copy=False)
+
+    def __setitem__(self, item, value):
+        self.array[item] = self._operand(value)
+
+    def __repr__(self):
+        return f"VectorArray({self.array.tolist()})"
+
+    def __array__(self, dtype=None, copy=None):
+        return self.array if dtype is None else self.array.astype(dtype)
+
+    def __xor__(self, other):
+        # Wedge product of each pair of rows
+        other = self._operand(other)
+        return self.array[:, 0] * other[..., 1] - self.array[:, 1] * other[..., 0]
+
+    def __add__(self, other):
+        return VectorArray(self.array + self._operand(other), copy=False)
+
+    def __sub__(self, other):
+        return VectorArray(self.array - self._operand(other), copy=False)
+
+    def __mul__(self, other):
+        if isinstance(other, (VectorArray, Vector)):
+            return self.dot(other)
+        return VectorArray(self.array * other, copy=False)
+
+    def __truediv__(self, other):
+        return VectorArray(self.array / other, copy=False)
+
+    def __iadd__(self, other):
+        self.array += self._operand(other)
+        return self
+
+    def __isub__(self, other):
+        self.array -= self._operand(other)
+        return self
+
+    def __imul__(self, other):
+        if isinstance(other, (VectorArray, Vector)):
+            return NotImplemented
+        self.array *= other
+        return self
+
+    def __itruediv__(self, other):
+        self.array /= other
+        return self
+
+    def __neg__(self):
+        return VectorArray(-self.array, copy=False)
+
+    def __abs__(self):
+        return self.mag()
+
+    def dot(self, other) -> numpy.ndarray:
+        """dot product of each row with the matching row of other, or with a single vector"""
+        other = self._operand(other)
+        return self.array[:, 0] * other[..., 0] + self.array[:, 1] * other[..., 1]
+
+    def mag(self) -> numpy.ndarray:
+        return numpy.hypot(self.array[:, 0], self.array[:, 1])
+
+    def normalise(self):
+        """unit vectors in the direction of each row, with zero rows becoming (1, 0) as in Vector.normalise"""
+        magnitudes = self.mag()
+        zero = magnitudes == 0
+        unit = self.array / numpy.where(zero, 1, magnitudes)[:, numpy.newaxis]
+        unit[zero] = (1, 0)
+        return VectorArray(unit, copy=False)
+
+    def hat(self):
+        return self / self.mag()[:, numpy.newaxis]
+
+    def rotate90(self):
+        return VectorArray(numpy.column_stack((-self.array[:, 1], self.array[:, 0])), copy=False)
+
+    def rotate(self, theta):
+        """rotates every row by theta radians, or each row by its own angle if theta is an array"""
+        return VectorArray(self._rotated(theta), copy=False)
+
+    def rotate_ip(self, theta):
+        self.array[:] = self._rotated(theta)
+
+    def _rotated(self, theta) -> numpy.ndarray:
+        if numpy.ndim(theta) == 0:
+            c, s = cos(theta), sin(theta)
+            return self.array @ numpy.array(((c, s), (-s, c)))
+        c, s = numpy.cos(theta), numpy.sin(theta)
+        x, y = self.array[:, 0], self.array[:, 1]
+        return numpy.column_stack((x * c - y * s, x * s + y * c))
+
+    @staticmethod
+    def compose(spaces) -> numpy.ndarray:
+        """collapses a chain of vector spaces into a single 3x3 homogeneous matrix, which applied to a point gives the
+        same result as Vector.transform applying each space in turn. a VectorSpaceChain's cached matrix is used as is"""
+        if isinstance(spaces, (VectorSpace, VectorSpaceChain)):
+            return numpy.array(spaces.get_matrix())
+
+        matrix = IDENTITY
+        for space in spaces:
+            if isinstance(space, VectorSpace):
+                matrix = compose_matrices(space.get_matrix(), matrix)
+        return numpy.array(matrix)
+
+    def apply_matrix(self, matrix):
+        """returns every row transformed by a 3x3 homogeneous matrix, as one matrix multiply"""
+        matrix = numpy.asarray(matrix)
+        return VectorArray(self.array @ matrix[:2, :2].T + matrix[:2, 2], copy=False)
+
+    def transform(self, spaces):
+        """applies each space's rotation then translation in turn to every row"""
+        return self.apply_matrix(self.compose(spaces))
+
+    def transform_inverse(self, spaces):
+        if isinstance(spaces, (VectorSpace, VectorSpaceChain)):
+            return self.apply_matrix(spaces.get_inverse_matrix())
+        return self.apply_matrix(numpy.linalg.inv(self.compose(spaces)))
+
+    def to_points(self) -> numpy.ndarray:
+        return self.array.astype(int)
+
+    def get_x(self) -> numpy.ndarray:
+        return self.array[:, 0]
+
+    def get_y(self) -> numpy.ndarray:
+        return self.array[:, 1]
+
+    def copy(self):
+        return VectorArray(self.array)
@@ -0,0 +1,83 @@
+# compares Vector against its previous unslotted implementation and pygame.Vector2 on the sort of tight loop particle
+# and physics code runs - run from the repository root with `python -m utilities.vector_benchmark`
+import sys
+import time
+import tracemalloc
+
+from utilities.vector import Vector
+
+try:
+    from pygame import Vector2
+except ImportError:
+    Vector2 = None
+
+
+class DictVector:
+    """the operations of Vector used below as they were before it was slotted - every operator allocates a new vector
+    through the checking constructor, and reads the other vector's components through its accessors"""
+
+    def __init__(self, values=(0, 0)):
+        if hasattr(values, '__iter__') and len(values) == 2:
+            self.x, self.y = values
+
+    def __add__(self, other):
+        if isinstance(other, (int, float)):
+            return DictVector((self.x + other, self.y + other))
+        elif isinstance(other, DictVector):
+            return DictVector((self.x + other.get_x(), self.y + other.get_y()))
+
+    def __mul__(self, other):
+        if isinstance(other, (int, float)):
+            return DictVector((self.x * other, self.y * other))
+        elif isinstance(other, DictVector):
+            return self.x * other.x + self.y * other.y
+
+    def get_x(self):
+        return self.x
+
+    def get_y(self):
+        return self.y
+
+
+def integrate(cls, n, steps, in_place):
+    """moves n points by their velocity scaled by a time step, steps times"""
+    positions = [cls((i, i)) for i in range(n)]
+    velocities = [cls((1.5, -0.5)) for _ in range(n)]
+    dt = 1 / 60
+    for _ in range(steps):
+        if in_place:
+            for position, velocity in zip(positions, velocities):
+                position += velocity * dt
+        else:
+            positions = [position + velocity * dt for position, velocity in zip(positions, velocities)]
+    return positions
+
+
+def benchmark(name, cls, in_place, n=10000, steps=20):
+    start = time.perf_counter()
+    integrate(cls, n, steps, in_place)
+    duration = time.perf_counter() - start
+
+    tracemalloc.start()
+    points = integrate(cls, n, steps, in_place)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    instance_size = sys.getsizeof(points[0]) + (sys.getsizeof(points[0].__dict__) if hasattr(points[0], "__dict__")
+                                                else 0)
+    print(f"{name}:\nDuration (s):\t\tPer update (ns):\t\tPeak allocated (KiB):\t\tInstance size (bytes):\n"
+          f"{round(duration, 4)}\t\t\t\t{round(duration / (n * steps) * 1e9, 1)}\t\t\t\t\t{round(peak / 1024, 1)}"
+          f"\t\t\t\t\t\t{instance_size}\n")
+
+
+def main():
+    benchmark("unslotted vector", DictVector, in_place=False)
+    benchmark("vector", Vector, in_place=False)
+    benchmark("vector in place", Vector, in_place=True)
+    if Vector2 is not None:
+        benchmark("pygame Vector2", Vector2, in_place=False)
+        benchmark("pygame Vector2 in place", Vector2, in_place=True)
+
+
+if __name__ == "__main__":
+    main()